@@ -0,0 +1,65 @@
+from flask import Flask
+
+
+# Build the app for a config class (KANBAN_ENV's by default). The HTML pages
+# and the JSON API are blueprints; a worker that only serves one of them
+# (SERVE_WEB / SERVE_API) never imports the other, nor the forms and chart
+# code behind the pages.
+def create_app(config=None):
+    from app.config import get_config
+    from app.database import db, set_sqlite_pragmas
+    from app.auth import user_cache, login_manager
+    from app.charts import chart_cache
+    from app.caching import payload_cache
+    from app.metrics import metrics
+    from app.writes import write_coalescer
+    from app.ranks import rebalancer
+    from app.migrations import upgrade
+    from app.commands import db_cli, jobs_cli, board_cli
+
+    app = Flask(__name__, template_folder="../templates", static_folder="../static")
+
+    app.config.from_object(config or get_config())
+
+    missing = [name for name in app.config.get("REQUIRED_SETTINGS", ()) if not app.config.get(name)]
+    if missing:
+        raise RuntimeError(f"{', '.join(missing)} must be set in the environment")
+
+    db.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            set_sqlite_pragmas(engine, app.config["SQLITE_PRAGMAS"])
+
+        if app.config.get("AUTO_MIGRATE"):
+            upgrade(db.engine)
+
+    chart_cache.init_app(app)
+
+    payload_cache.init_app(app)
+
+    metrics.init_app(app)
+
+    user_cache.init_app(app)
+
+    write_coalescer.init_app(app)
+
+    rebalancer.init_app(app)
+
+    login_manager.init_app(app)
+
+    app.cli.add_command(db_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(board_cli)
+
+    if app.config.get("SERVE_WEB", True):
+        from app.controllers import web
+        from app.fragments import fragment_cache
+        fragment_cache.init_app(app)
+        app.register_blueprint(web)
+
+    if app.config.get("SERVE_API", True):
+        from app.api import api_blueprint
+        app.register_blueprint(api_blueprint)
+
+    return app
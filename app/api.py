@@ -1,9 +1,25 @@
-from flask_restful import Resource
-from flask_restful import fields, marshal_with, reqparse
-from app.validation import ListValidationError, CardValidationError, UserValidationError
-from app.database import db
+from flask_restful import Api, Resource
+from flask_restful import fields, reqparse
+from flask import Blueprint, request, current_app, Response, stream_with_context
+from sqlalchemy import select, insert, update, delete, case
+from app.validation import ListValidationError, CardValidationError, UserValidationError, SearchValidationError, TransferValidationError, ChangesValidationError
+from app.database import db, read_only
 from app.models import User, List, Card
+from app.charts import chart_cache
+from app.writes import write_coalescer
+from app.ranks import rank_between, neighbours, rebalance, rebalancer, assign_ranks
+from app.board import load_board
+from app.caching import conditional_get, list_etag, card_etag, board_etag, projected_etag, if_match_versions, format_list_etag, format_card_etag
+from app.serializers import Serializer, parse_fields, dumps, output_json
+from app.search import fts_query, search_cards
+from app.deadlines import due_cards
+from app.archive import archived_page
+from app.changes import latest_change_id, is_stale, changes_after, with_data, StreamSlots
+from app.transfer import FORMATS, ENCODERS, DECODERS, export_records, import_records
+from flask_login import current_user
 from datetime import datetime
+from functools import lru_cache
+from time import monotonic, sleep
 
 other_response = {
     "message": fields.String
@@ -24,6 +40,9 @@ create_list_parser.add_argument('user_id')
 update_list_parser = reqparse.RequestParser()
 update_list_parser.add_argument('name')
 
+patch_list_parser = reqparse.RequestParser()
+patch_list_parser.add_argument('name', store_missing=False)
+
 
 card_output_fields = {
     "card_id": fields.Integer,
@@ -35,8 +54,139 @@ card_output_fields = {
     "created_at": fields.DateTime,
     "updated_at": fields.DateTime,
     "completed_datetime": fields.DateTime,
+    "rank": fields.String,
+}
+
+board_list_fields = dict(list_output_fields, cards=fields.List(fields.Nested(card_output_fields)))
+
+board_output_fields = {
+    "user": fields.Integer,
+    "lists": fields.List(fields.Nested(board_list_fields))
+}
+
+board_parser = reqparse.RequestParser()
+board_parser.add_argument('user_id', location='args')
+
+card_page_fields = {
+    "cards": fields.List(fields.Nested(card_output_fields)),
+    "next_cursor": fields.Integer(default = None)
+}
+
+list_cards_parser = reqparse.RequestParser()
+list_cards_parser.add_argument('after', type=int, location='args')
+list_cards_parser.add_argument('limit', type=int, location='args', default=100)
+list_cards_parser.add_argument('completed', type=int, choices=(0, 1), location='args')
+list_cards_parser.add_argument('deadline_from', location='args')
+list_cards_parser.add_argument('deadline_to', location='args')
+list_cards_parser.add_argument('stream', type=int, choices=(0, 1), location='args', default=0)
+
+archived_card_fields = dict(card_output_fields, archived_at=fields.DateTime)
+
+archived_page_fields = {
+    "cards": fields.List(fields.Nested(archived_card_fields)),
+    "next_cursor": fields.Integer(default = None)
+}
+
+archived_cards_parser = reqparse.RequestParser()
+archived_cards_parser.add_argument('after', type=int, location='args')
+archived_cards_parser.add_argument('limit', type=int, location='args', default=100)
+
+change_fields = {
+    "change_id": fields.Integer,
+    "entity": fields.String,
+    "id": fields.Integer(attribute = "entity_id"),
+    "list": fields.Integer(attribute = "list_id"),
+    "operation": fields.String,
+    "changed_at": fields.DateTime,
+    "data": fields.Raw
 }
 
+changes_page_fields = {
+    "changes": fields.List(fields.Nested(change_fields)),
+    "cursor": fields.Integer,
+    "more": fields.Boolean
+}
+
+changes_parser = reqparse.RequestParser()
+changes_parser.add_argument('since', type=int, location='args')
+changes_parser.add_argument('user_id', location='args')
+changes_parser.add_argument('limit', type=int, location='args', default=100)
+changes_parser.add_argument('stream', type=int, choices=(0, 1), location='args', default=0)
+
+search_result_fields = {
+    "card_id": fields.Integer,
+    "title": fields.String,
+    "list": fields.Integer,
+    "deadline": fields.String,
+    "completed": fields.Integer,
+    "snippet": fields.String,
+    "score": fields.Float # bm25, lower is better; "rank" is the position of a card
+}
+
+search_page_fields = {
+    "results": fields.List(fields.Nested(search_result_fields)),
+    "next_offset": fields.Integer(default = None)
+}
+
+search_parser = reqparse.RequestParser()
+search_parser.add_argument('q', location='args')
+search_parser.add_argument('user_id', location='args')
+search_parser.add_argument('limit', type=int, location='args', default=20)
+search_parser.add_argument('offset', type=int, location='args', default=0)
+
+deadline_card_fields = dict(card_output_fields, list_name=fields.String)
+
+deadline_output_fields = {
+    "user": fields.Integer,
+    "today": fields.String,
+    "days": fields.Integer,
+    "overdue": fields.List(fields.Nested(deadline_card_fields)),
+    "due_soon": fields.List(fields.Nested(deadline_card_fields))
+}
+
+deadlines_parser = reqparse.RequestParser()
+deadlines_parser.add_argument('user_id', location='args')
+deadlines_parser.add_argument('days', type=int, location='args')
+deadlines_parser.add_argument('limit', type=int, location='args', default=100)
+
+transfer_parser = reqparse.RequestParser()
+transfer_parser.add_argument('user_id', location='args')
+transfer_parser.add_argument('format', location='args')
+
+
+# Field specs compiled once, see app/serializers.py
+list_serializer = Serializer(list_output_fields)
+card_serializer = Serializer(card_output_fields)
+search_page_serializer = Serializer(search_page_fields)
+deadline_serializer = Serializer(deadline_output_fields)
+archived_page_serializer = Serializer(archived_page_fields)
+change_serializer = Serializer(change_fields)
+changes_page_serializer = Serializer(changes_page_fields)
+
+
+# Serializers of the cards, the board and a page of cards with only the
+# given card fields (all of them for None). There are at most 2^9 distinct
+# selections, each built once.
+@lru_cache(maxsize=None)
+def card_serializers(names):
+    cards = card_serializer.select(names) if names else card_serializer
+    board_lists = dict(list_output_fields, cards=fields.List(fields.Nested(cards.spec)))
+    board = Serializer(dict(board_output_fields, lists=fields.List(fields.Nested(board_lists))))
+    page = Serializer(dict(card_page_fields, cards=fields.List(fields.Nested(cards.spec))))
+    return cards, board, page
+
+
+# Fields selected with ?fields=, e.g. ?fields=card_id,title,deadline to leave
+# out the contents of cards; None when every field is wanted
+def requested_fields(serializer, error, error_code):
+    names = parse_fields(request.args.get("fields"))
+    if names is not None:
+        try:
+            serializer.select(names)
+        except KeyError as e:
+            raise error(status_code = 400, error_code = error_code, error_message = f"unknown field {e.args[0]}")
+    return names
+
 
 create_card_parser = reqparse.RequestParser()
 create_card_parser.add_argument('title')
@@ -51,21 +201,139 @@ update_card_parser.add_argument('content')
 update_card_parser.add_argument('deadline')
 update_card_parser.add_argument('completed')
 
+# only the fields a PATCH sends are in its arguments
+patch_card_parser = reqparse.RequestParser()
+patch_card_parser.add_argument('title', store_missing=False)
+patch_card_parser.add_argument('content', store_missing=False)
+patch_card_parser.add_argument('deadline', store_missing=False)
+patch_card_parser.add_argument('completed', store_missing=False)
+
+move_card_parser = reqparse.RequestParser()
+move_card_parser.add_argument('list', type=int)
+move_card_parser.add_argument('after', type=int)
+move_card_parser.add_argument('before', type=int)
+
+
+# Check a card payload the way CardAPI does and return the column values:
+# the deadline parsed to a date and completed_datetime set for completed cards
+def validate_card_fields(data, require_list = False):
+    title = data.get("title", None)
+    content = data.get("content", None)
+    deadline = data.get("deadline", None)
+    completed = data.get("completed", None)
+    list = data.get("list", None)
+
+    if title is None:
+        raise CardValidationError(status_code = 400, error_code = "C101", error_message =  "title is required")
+
+    if content is None:
+        raise CardValidationError(status_code = 400, error_code = "C102", error_message =  "content is required")
+
+    if deadline is None:
+        raise CardValidationError(status_code = 400, error_code = "C103", error_message =  "deadline is required")
+
+    if completed is None:
+        raise CardValidationError(status_code = 400, error_code = "C104", error_message =  "completed flag is required")
+
+    if require_list and list is None:
+        raise CardValidationError(status_code = 400, error_code = "C105", error_message =  "list id is required")
+
+    try:
+        deadline = datetime.strptime(str(deadline), '%Y-%m-%d').date()
+    except ValueError:
+        raise CardValidationError(status_code = 400, error_code = "C103", error_message =  "deadline must be in YYYY-MM-DD format")
+
+    completed = str(completed)
+
+    completed_datetime = None
+
+    if completed == '1':
+        completed_datetime = datetime.now()
+
+    card = {
+        "title": title,
+        "content": content,
+        "deadline": deadline,
+        "completed": completed,
+        "completed_datetime": completed_datetime
+    }
+
+    if require_list:
+        card["list"] = list
+
+    return card
+
+
+# Check a partial card payload and return the values of the columns it
+# changes. Marking a card completed keeps the completion time of a card that
+# already was, so that the UPDATE does not depend on a read of the row.
+def validate_card_patch(data):
+    values = {}
+
+    if "title" in data:
+        if data["title"] is None:
+            raise CardValidationError(status_code = 400, error_code = "C101", error_message =  "title is required")
+        values["title"] = data["title"]
+
+    if "content" in data:
+        if data["content"] is None:
+            raise CardValidationError(status_code = 400, error_code = "C102", error_message =  "content is required")
+        values["content"] = data["content"]
+
+    if "deadline" in data:
+        try:
+            values["deadline"] = datetime.strptime(str(data["deadline"]), '%Y-%m-%d').date()
+        except ValueError:
+            raise CardValidationError(status_code = 400, error_code = "C103", error_message =  "deadline must be in YYYY-MM-DD format")
+
+    if "completed" in data:
+        completed = str(data["completed"])
+        if completed not in ("0", "1"):
+            raise CardValidationError(status_code = 400, error_code = "C104", error_message =  "completed flag must be 0 or 1")
+        values["completed"] = int(completed)
+        if completed == "1":
+            values["completed_datetime"] = case((Card.completed == 1, Card.completed_datetime), else_ = datetime.now())
+        else:
+            values["completed_datetime"] = None
+
+    if not values:
+        raise CardValidationError(status_code = 400, error_code = "C114", error_message =  "nothing to update")
+
+    return values
+
+
+# One UPDATE of the given columns of a row, which bumps its row_version and
+# returns the new row. With `versions` (from If-Match) it only applies while
+# the row still has one of them, so a concurrent edit is never overwritten.
+def conditional_update(table, key, id, values, versions):
+    stmt = update(table).where(key == id).values(dict(values, updated_at = datetime.now(), row_version = table.c.row_version + 1))
+    if versions is not None:
+        stmt = stmt.where(table.c.row_version.in_(versions))
+    return stmt.returning(*table.c)
+
 
 
 # CRUD on Lists
 class ListAPI(Resource):
-    @marshal_with(list_output_fields)
+    @read_only
     def get(self, id): # get a list by id
-        list = List.query.get(id)
+        names = requested_fields(list_serializer, ListValidationError, "L105")
+        serializer = list_serializer.select(names) if names else list_serializer
+
+        def load():
+            list = List.query.get(id)
+            if list is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+            return serializer(list), list.updated_at or list.created_at
 
-        if list:
-            return list, 200
+        response = conditional_get(("list", id, names), projected_etag(list_etag(id), names), load)
+
+        if response:
+            return response
         else:
             raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
 
 
-    @marshal_with(list_output_fields)
     def post(self): # create a list for a user
         args = create_list_parser.parse_args()
         name = args.get("name", None)
@@ -77,26 +345,27 @@ class ListAPI(Resource):
         if user_id is None:
             raise ListValidationError(status_code = 400, error_code = "L102", error_message =  "user id is required")
 
-        user = User.query.get(user_id)
+        def create():
+            user = User.query.get(user_id)
 
-        if user is None:
-            raise UserValidationError(error_code = "U101", error_message = "User does not exist")
-        
-        lists = db.session.query(List).filter((List.user == user_id)).all()
+            if user is None:
+                raise UserValidationError(error_code = "U101", error_message = "User does not exist")
 
-        if len(lists)>4:
-            raise ListValidationError(status_code = 400, error_code = "L103", error_message =  "Cannot create more than 5 lists for a user")
-        
-        new_list = List(name=name, user=user_id)
-        db.session.add(new_list)
-        db.session.commit()
-        db.session.refresh(new_list)
+            lists = db.session.query(List).filter((List.user == user_id)).all()
 
-        return new_list, 201
+            if len(lists)>4:
+                raise ListValidationError(status_code = 400, error_code = "L103", error_message =  "Cannot create more than 5 lists for a user")
+
+            new_list = List(name=name, user=user_id)
+            db.session.add(new_list)
+            db.session.flush()
+            db.session.refresh(new_list)
+            return list_serializer(new_list)
+
+        return write_coalescer.run(create), 201
 
 
     
-    @marshal_with(list_output_fields)
     def put(self, id): # update a list by id
         args  = update_list_parser.parse_args()
         name = args.get('name', None)
@@ -104,26 +373,53 @@ class ListAPI(Resource):
         if name is None:
             raise ListValidationError(status_code = 400, error_code = "L101", error_message =  "name is required")
 
-        list = List.query.get(id)
+        def update():
+            list = List.query.get(id)
 
-        if list is None:
-            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+            if list is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
 
-        list.name = name
-        db.session.add(list)
-        db.session.commit()
+            list.name = name
+            db.session.add(list)
+            db.session.flush()
+            db.session.refresh(list)
+            return list_serializer(list)
 
-        return list, 200
+        return write_coalescer.run(update), 200
+
+
+    def patch(self, id): # rename a list, if it is still the version of If-Match
+        args = patch_list_parser.parse_args()
+        versions = if_match_versions(request.if_match, format_list_etag, id)
+
+        if args.get("name", None) is None:
+            raise ListValidationError(status_code = 400, error_code = "L101", error_message =  "name is required")
+
+        def patch():
+            row = db.session.execute(conditional_update(List.__table__, List.list_id, id, {"name": args["name"]}, versions)).first()
+
+            if row is None:
+                if db.session.get(List, id) is None:
+                    raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+                raise ListValidationError(status_code = 412, error_code = "L106", error_message =  "List was changed since the version in If-Match")
+
+            return list_serializer(row), row.row_version
+
+        output, version = write_coalescer.run(patch)
+        return output, 200, {"ETag": f'"{format_list_etag(id, version)}"'}
 
 
     def delete(self, id): # delete a list by id
-        list = List.query.get(id)
+        def remove():
+            list = List.query.get(id)
 
-        if list is None:
-            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+            if list is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+            db.session.delete(list)
 
-        db.session.delete(list)
-        db.session.commit()
+        write_coalescer.run(remove)
+        chart_cache.evict(id)
 
         response = {
             "message": "List has been deleted successfully"
@@ -137,119 +433,629 @@ class ListAPI(Resource):
 
 # CRUD on Cards
 class CardAPI(Resource):
-    @marshal_with(card_output_fields)
+    @read_only
     def get(self, id): # get a card by id
-        card = Card.query.get(id)
+        names = requested_fields(card_serializer, CardValidationError, "C110")
+        serializer = card_serializers(names)[0]
 
-        if card:
-            return card, 200
+        def load():
+            card = Card.query.get(id)
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+            return serializer(card), card.updated_at or card.created_at
+
+        response = conditional_get(("card", id, names), projected_etag(card_etag(id), names), load)
+
+        if response:
+            return response
         else:
             raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
 
 
 
-    @marshal_with(card_output_fields)
     def post(self): # create a card for a list
         args = create_card_parser.parse_args()
-        title = args.get("title", None)
-        content = args.get("content", None)
-        deadline = args.get("deadline", None)
-        completed = args.get("completed", None)
-        list = args.get("list", None)
-
-        if title is None:
-            raise CardValidationError(status_code = 400, error_code = "C101", error_message =  "title is required")
-        
-        if content is None:
-            raise CardValidationError(status_code = 400, error_code = "C102", error_message =  "content is required")
-        
-        if deadline is None:
-            raise CardValidationError(status_code = 400, error_code = "C103", error_message =  "deadline is required")
-        
-        if completed is None:
-            raise CardValidationError(status_code = 400, error_code = "C104", error_message =  "completed flag is required")
-        
-        if list is None:
-            raise CardValidationError(status_code = 400, error_code = "C105", error_message =  "list id is required")
+        card = validate_card_fields(args, require_list = True)
 
-        list_q = List.query.get(list)
+        def create():
+            list_q = List.query.get(card["list"])
 
-        if list_q is None:
-            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+            if list_q is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
 
-        deadline = datetime.strptime(deadline, '%Y-%m-%d').date()
+            new_card = Card(**card)
+            db.session.add(new_card)
+            db.session.flush()
+            db.session.refresh(new_card)
+            return card_serializer(new_card)
 
-        completed_datetime = None
-
-        if completed == '1':
-            completed_datetime = datetime.now()
-        
-        new_card = Card(title=title, content=content, deadline=deadline, completed=completed, list=list, completed_datetime=completed_datetime)
-        db.session.add(new_card)
-        db.session.commit()
-        db.session.refresh(new_card)
-
-        return new_card, 201
+        return write_coalescer.run(create), 201
 
 
     
-    @marshal_with(card_output_fields)
     def put(self, id): # update a card by id
         args = update_card_parser.parse_args()
-        title = args.get("title", None)
-        content = args.get("content", None)
-        deadline = args.get("deadline", None)
-        completed = args.get("completed", None)
+        values = validate_card_fields(args)
 
-        if title is None:
-            raise CardValidationError(status_code = 400, error_code = "C101", error_message =  "title is required")
-        
-        if content is None:
-            raise CardValidationError(status_code = 400, error_code = "C102", error_message =  "content is required")
-        
-        if deadline is None:
-            raise CardValidationError(status_code = 400, error_code = "C103", error_message =  "deadline is required")
-        
-        if completed is None:
-            raise CardValidationError(status_code = 400, error_code = "C104", error_message =  "completed flag is required")
+        def update():
+            card = Card.query.get(id)
 
-        card = Card.query.get(id)
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
 
-        if card is None:
-            raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+            card.title = values["title"]
+            card.content = values["content"]
+            card.deadline = values["deadline"]
+            card.completed = values["completed"]
+            card.completed_datetime = values["completed_datetime"]
 
-        deadline = datetime.strptime(deadline, '%Y-%m-%d').date()
+            db.session.add(card)
+            db.session.flush()
+            db.session.refresh(card)
+            return card_serializer(card)
 
-        completed_datetime = None
-        
-        if completed == '1':
-            completed_datetime = datetime.now()
+        return write_coalescer.run(update), 200
 
 
-        card.title = title
-        card.content = content
-        card.deadline = deadline
-        card.completed = completed
-        card.completed_datetime = completed_datetime
+    def patch(self, id): # update some fields of a card, if it is still the version of If-Match
+        values = validate_card_patch(patch_card_parser.parse_args())
+        versions = if_match_versions(request.if_match, format_card_etag, id)
 
+        def patch():
+            row = db.session.execute(conditional_update(Card.__table__, Card.card_id, id, values, versions)).first()
 
-        db.session.add(card)
-        db.session.commit()
+            if row is None:
+                if db.session.get(Card, id) is None:
+                    raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+                raise CardValidationError(status_code = 412, error_code = "C113", error_message =  "Card was changed since the version in If-Match")
 
-        return card, 200
+            return card_serializer(row), row.row_version
+
+        output, version = write_coalescer.run(patch)
+        return output, 200, {"ETag": f'"{format_card_etag(id, version)}"'}
 
 
     def delete(self, id): # delete a card by id
-        card = Card.query.get(id)
+        def remove():
+            card = Card.query.get(id)
 
-        if card is None:
-            raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
 
-        db.session.delete(card)
-        db.session.commit()
+            db.session.delete(card)
+
+        write_coalescer.run(remove)
 
         response = {
             "message": "Card has been deleted successfully"
         }
 
-        return response, 200
\ No newline at end of file
+        return response, 200
+
+
+
+# Move a card within its list or to another list: after the card ?after=,
+# before the card ?before=, or at the end of the list. Only the card's own
+# rank (and list) is written; when its neighbours share a rank the list is
+# rebalanced first, and when the new rank gets too long it is rebalanced in
+# the background.
+class CardMoveAPI(Resource):
+    def patch(self, id):
+        args = move_card_parser.parse_args()
+
+        def neighbour(card_id, list_id):
+            if card_id is None:
+                return None
+            card = Card.query.get(card_id)
+            if card is None or card.list != list_id or card.card_id == id:
+                raise CardValidationError(status_code = 400, error_code = "C111", error_message =  f"card {card_id} is not another card of list {list_id}")
+            return card
+
+        def move():
+            card = Card.query.get(id)
+
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+
+            list_id = args["list"] if args["list"] is not None else card.list
+
+            if list_id != card.list and List.query.get(list_id) is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+            after = neighbour(args["after"], list_id)
+            before = neighbour(args["before"], list_id)
+
+            if after is not None and before is not None and (after.rank, after.card_id) >= (before.rank, before.card_id):
+                raise CardValidationError(status_code = 400, error_code = "C112", error_message =  "after must come before before")
+
+            rank = rank_between(*neighbours(list_id, id, after, before))
+            if rank is None: # the neighbours share a rank
+                rebalance(list_id)
+                for other in (after, before):
+                    if other is not None:
+                        db.session.refresh(other)
+                rank = rank_between(*neighbours(list_id, id, after, before))
+
+            card.list = list_id
+            card.rank = rank
+            db.session.flush()
+            db.session.refresh(card)
+            return card_serializer(card)
+
+        card = write_coalescer.run(move)
+
+        if rebalancer.needed(card["rank"]):
+            rebalancer.schedule(card["list"])
+
+        return card, 200
+
+
+
+# Resolve the user a request is about: the logged in user. A ?user_id= is
+# still accepted, but only if it is that user's.
+def get_user_id(user_id):
+    if not current_user.is_authenticated:
+        raise UserValidationError(status_code = 401, error_code = "U103", error_message = "login is required")
+
+    if user_id is not None and str(user_id) != str(current_user.id):
+        raise UserValidationError(status_code = 403, error_code = "U104", error_message = "Cannot access another user's board")
+
+    return current_user.id
+
+
+
+# Whole board of a user
+class BoardAPI(Resource):
+    @read_only
+    def get(self): # get all lists of a user with their cards
+        args = board_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+        names = requested_fields(card_serializer, CardValidationError, "C110") # fields of the cards
+        serializer = card_serializers(names)[1]
+
+        def load():
+            board = {
+                "user": user_id,
+                "lists": load_board(user_id)
+            }
+            return serializer(board), None
+
+        return conditional_get(("board", user_id, names), projected_etag(board_etag(user_id), names), load)
+
+
+
+# Look up which of the given ids exist, in chunks to stay below SQLite's
+# limit on bound parameters
+def existing_ids(column, ids, chunk_size = 500):
+    ids = [id for id in set(ids) if id is not None]
+    found = set()
+    for start in range(0, len(ids), chunk_size):
+        found.update(db.session.scalars(select(column).where(column.in_(ids[start:start + chunk_size]))))
+    return found
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Create, update and delete many cards in one request and one transaction.
+# Every operation is validated on its own and gets its own result; invalid
+# operations are reported and skipped, the valid ones are written together.
+class CardBulkAPI(Resource):
+    def post(self):
+        operations = request.get_json(silent = True)
+
+        if isinstance(operations, dict):
+            operations = operations.get("operations", None)
+
+        if not isinstance(operations, list):
+            raise CardValidationError(status_code = 400, error_code = "C107", error_message =  "a list of operations is required")
+
+        if len(operations) > current_app.config.get("BULK_MAX_OPERATIONS", 10000):
+            raise CardValidationError(status_code = 400, error_code = "C108", error_message =  "too many operations in one request")
+
+        results = [None] * len(operations)
+        creates, updates, deletes = [], [], []
+
+        # first pass: check the payloads and collect the referenced ids
+        for index, operation in enumerate(operations):
+            try:
+                if not isinstance(operation, dict) or operation.get("op") not in ("create", "update", "delete"):
+                    raise CardValidationError(status_code = 400, error_code = "C107", error_message =  "op must be create, update or delete")
+
+                op = operation["op"]
+
+                if op == "create":
+                    card = validate_card_fields(operation, require_list = True)
+                    card["list"] = parse_id(card["list"])
+                    creates.append((index, card))
+                    continue
+
+                card_id = parse_id(operation.get("card_id", None))
+                if card_id is None:
+                    raise CardValidationError(status_code = 400, error_code = "C106", error_message =  "card id is required")
+
+                if op == "update":
+                    card = validate_card_fields(operation)
+                    card["card_id"] = card_id
+                    updates.append((index, card))
+                else:
+                    deletes.append((index, {"card_id": card_id}))
+            except (CardValidationError, ListValidationError) as e:
+                results[index] = {"index": index, "status": e.status_code, "error_code": e.error_code, "error_message": e.error_message}
+
+        # second pass, in one transaction: resolve all referenced lists and
+        # cards with a few IN queries, then write everything with
+        # executemany statements
+        def write():
+            lists = existing_ids(List.list_id, [card["list"] for index, card in creates])
+            cards = existing_ids(Card.card_id, [card["card_id"] for index, card in updates + deletes])
+
+            def resolved(operations, key, found, error):
+                valid = []
+                for index, card in operations:
+                    if card[key] in found:
+                        valid.append((index, card))
+                    else:
+                        results[index] = dict(error, index = index)
+                return valid
+
+            valid_creates = resolved(creates, "list", lists, {"status": 404, "error_code": "L104", "error_message": "List does not exist"})
+            valid_updates = resolved(updates, "card_id", cards, {"status": 404, "error_code": "C106", "error_message": "Card does not exist"})
+            valid_deletes = resolved(deletes, "card_id", cards, {"status": 404, "error_code": "C106", "error_message": "Card does not exist"})
+
+            if valid_creates:
+                # batched into multi-row INSERT ... RETURNING statements, the
+                # ids come back in the order of the cards
+                assign_ranks([card for index, card in valid_creates])
+                stmt = insert(Card.__table__).returning(Card.__table__.c.card_id, sort_by_parameter_order = True)
+                card_ids = db.session.scalars(stmt, [card for index, card in valid_creates]).all()
+                for (index, card), card_id in zip(valid_creates, card_ids):
+                    results[index] = {"index": index, "status": 201, "card_id": card_id}
+
+            if valid_updates:
+                db.session.execute(update(Card), [card for index, card in valid_updates])
+                for index, card in valid_updates:
+                    results[index] = {"index": index, "status": 200, "card_id": card["card_id"]}
+
+            if valid_deletes:
+                ids = [card["card_id"] for index, card in valid_deletes]
+                for start in range(0, len(ids), 500):
+                    db.session.execute(delete(Card).where(Card.card_id.in_(ids[start:start + 500])))
+                for index, card in valid_deletes:
+                    results[index] = {"index": index, "status": 200, "card_id": card["card_id"]}
+
+        write_coalescer.run(write)
+
+        response = {
+            "results": results
+        }
+
+        return response, 200
+
+
+
+def parse_date(value, error_code, name):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CardValidationError(status_code = 400, error_code = error_code, error_message =  f"{name} must be in YYYY-MM-DD format")
+
+
+# Cards of one list, oldest first, with keyset pagination on card_id.
+# ?after=<card_id> continues after the last card of the previous page and
+# ?stream=1 (or Accept: application/x-ndjson) streams every matching card as
+# NDJSON from a server side cursor instead of building a page in memory.
+class ListCardsAPI(Resource):
+    @read_only
+    def get(self, id):
+        args = list_cards_parser.parse_args()
+        cards, _, page_serializer = card_serializers(requested_fields(card_serializer, CardValidationError, "C110"))
+
+        if db.session.get(List, id) is None:
+            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+        stmt = select(*Card.__table__.c).where(Card.list == id).order_by(Card.card_id)
+
+        if args["after"] is not None:
+            stmt = stmt.where(Card.card_id > args["after"])
+
+        if args["completed"] is not None:
+            stmt = stmt.where(Card.completed == args["completed"])
+
+        deadline_from = parse_date(args["deadline_from"], "C103", "deadline_from")
+        if deadline_from is not None:
+            stmt = stmt.where(Card.deadline >= deadline_from)
+
+        deadline_to = parse_date(args["deadline_to"], "C103", "deadline_to")
+        if deadline_to is not None:
+            stmt = stmt.where(Card.deadline <= deadline_to)
+
+        if args["stream"] or request.accept_mimetypes.best == "application/x-ndjson":
+            return self.stream(stmt, cards)
+
+        limit = min(max(args["limit"], 1), current_app.config.get("CARD_PAGE_MAX_LIMIT", 1000))
+        rows = db.session.execute(stmt.limit(limit + 1)).all()
+
+        page = {
+            "cards": rows[:limit],
+            "next_cursor": rows[limit - 1].card_id if len(rows) > limit else None
+        }
+
+        return page_serializer(page), 200
+
+    def stream(self, stmt, serializer):
+        def generate():
+            result = db.session.execute(stmt.execution_options(yield_per = 1000))
+            for row in result:
+                yield dumps(serializer(row)) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype = "application/x-ndjson")
+
+
+
+# Archived cards of a list (see app/archive.py), a page of ?limit= cards at
+# a time in card_id order; ?after= is the next_cursor of the previous page
+class ArchivedCardsAPI(Resource):
+    @read_only
+    def get(self, id):
+        args = archived_cards_parser.parse_args()
+
+        if db.session.get(List, id) is None:
+            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+        limit = min(max(args["limit"], 1), current_app.config.get("ARCHIVE_PAGE_MAX_LIMIT", 1000))
+        rows = archived_page(id, args["after"], limit)
+
+        page = {
+            "cards": rows[:limit],
+            "next_cursor": rows[limit - 1].card_id if len(rows) > limit else None
+        }
+
+        return archived_page_serializer(page), 200
+
+
+
+# Cursor of a change feed request: ?since=, or the Last-Event-ID of an
+# EventSource that reconnects. None when the client did not send one.
+def requested_cursor(since, last_event_id):
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    if since is not None and since < 0:
+        raise ChangesValidationError(status_code = 400, error_code = "F102", error_message =  "since must not be negative")
+
+    return since
+
+
+def stale_cursor_error():
+    return ChangesValidationError(status_code = 410, error_code = "F101", error_message =  "cursor is older than the retained changes, load the board again")
+
+
+def too_many_streams_error():
+    error = ChangesValidationError(status_code = 503, error_code = "F103", error_message =  "too many open change streams, try again later")
+    error.response.headers["Retry-After"] = "5"
+    return error
+
+
+def wants_stream(stream, accept_mimetypes):
+    return bool(stream) or accept_mimetypes.best == "text/event-stream"
+
+
+# One change as a Server-Sent Event, its change_id as the event id
+def change_event(entry):
+    return f"id: {entry['change_id']}\nevent: change\ndata: {dumps(change_serializer(entry))}\n\n"
+
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# open streams of the sync fallback below, each of which holds a worker
+stream_slots = StreamSlots()
+
+
+# Changes to the lists and cards of a user after the cursor ?since= (see
+# app/changes.py), oldest first, with the current state of every changed
+# row. Without ?since= only the current cursor is returned, for a client
+# that just loaded the board. With ?stream=1 or Accept: text/event-stream the
+# changes are pushed as Server-Sent Events until CHANGES_STREAM_TIMEOUT,
+# after which EventSource reconnects from the Last-Event-ID it got.
+#
+# Under the ASGI app the streams are served by an async handler (see
+# app/asgi.py); the stream below is a fallback for WSGI servers, where it
+# holds a worker for its whole length, so at most CHANGES_MAX_STREAMS of them
+# are open per process.
+class ChangesAPI(Resource):
+    @read_only
+    def get(self):
+        args = changes_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+        stream = wants_stream(args["stream"], request.accept_mimetypes)
+        since = requested_cursor(args["since"], request.headers.get("Last-Event-ID"))
+
+        if since is None:
+            if not stream:
+                return changes_page_serializer({"changes": [], "cursor": latest_change_id(), "more": False}), 200
+            since = latest_change_id()
+
+        if is_stale(since):
+            raise stale_cursor_error()
+
+        limit = min(max(args["limit"], 1), current_app.config.get("CHANGES_PAGE_MAX_LIMIT", 1000))
+
+        if stream:
+            if not stream_slots.acquire(current_app.config.get("CHANGES_MAX_STREAMS", 4)):
+                raise too_many_streams_error()
+            try:
+                response = self.stream(user_id, since, limit)
+            except Exception:
+                stream_slots.release()
+                raise
+            response.call_on_close(stream_slots.release)
+            return response
+
+        rows = changes_after(user_id, since, limit)
+
+        page = {
+            "changes": with_data(rows[:limit], list_serializer, card_serializer),
+            "cursor": rows[:limit][-1].change_id if rows else since,
+            "more": len(rows) > limit
+        }
+
+        return changes_page_serializer(page), 200
+
+    # Poll the change log every CHANGES_POLL_INTERVAL seconds and send what
+    # is new; a comment line every CHANGES_HEARTBEAT seconds keeps idle
+    # connections open through proxies
+    def stream(self, user_id, since, limit):
+        interval = current_app.config.get("CHANGES_POLL_INTERVAL", 1)
+        timeout = current_app.config.get("CHANGES_STREAM_TIMEOUT", 60)
+        heartbeat = current_app.config.get("CHANGES_HEARTBEAT", 15)
+
+        def generate():
+            cursor = since
+            started = last_sent = monotonic()
+            yield f"retry: {int(interval * 1000)}\n\n"
+
+            while True:
+                rows = changes_after(user_id, cursor, limit)
+                entries = with_data(rows[:limit], list_serializer, card_serializer)
+                db.session.close() # no transaction or connection held between polls
+
+                for entry in entries:
+                    cursor = entry["change_id"]
+                    yield change_event(entry)
+
+                now = monotonic()
+                if entries:
+                    last_sent = now
+                elif now - last_sent >= heartbeat:
+                    yield ": keepalive\n\n"
+                    last_sent = now
+
+                if now - started >= timeout:
+                    return
+                if len(rows) <= limit:
+                    sleep(interval)
+
+        return Response(stream_with_context(generate()), mimetype = "text/event-stream", headers = STREAM_HEADERS)
+
+
+
+# Full-text search over the titles and contents of a user's cards, best
+# matches first. Every word of ?q= is matched as a prefix; ?limit= and
+# ?offset= page through the results.
+class SearchAPI(Resource):
+    @read_only
+    def get(self):
+        args = search_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+
+        query = fts_query(args["q"])
+        if query is None:
+            raise SearchValidationError(status_code = 400, error_code = "S101", error_message =  "search query is required")
+
+        limit = min(max(args["limit"], 1), current_app.config.get("SEARCH_MAX_LIMIT", 100))
+        offset = max(args["offset"], 0)
+        rows = search_cards(user_id, query, limit + 1, offset)
+
+        page = {
+            "results": rows[:limit],
+            "next_offset": offset + limit if len(rows) > limit else None
+        }
+
+        return search_page_serializer(page), 200
+
+
+
+# Incomplete cards of a user past their deadline or due within ?days= days
+# (DEADLINE_SOON_DAYS by default), soonest first, at most ?limit= of them
+class DeadlinesAPI(Resource):
+    @read_only
+    def get(self):
+        args = deadlines_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+
+        days = args["days"] if args["days"] is not None else current_app.config.get("DEADLINE_SOON_DAYS", 3)
+        if days < 0:
+            raise CardValidationError(status_code = 400, error_code = "C109", error_message =  "days must not be negative")
+
+        limit = min(max(args["limit"], 1), current_app.config.get("CARD_PAGE_MAX_LIMIT", 1000))
+        today = datetime.today().date()
+        cards = due_cards(user_id, days, limit, today)
+
+        deadlines = {
+            "user": user_id,
+            "today": today.isoformat(),
+            "days": days,
+            "overdue": [card for card in cards if card.deadline < today],
+            "due_soon": [card for card in cards if card.deadline >= today]
+        }
+
+        return deadline_serializer(deadlines), 200
+
+
+
+# Format of an export or import: ?format=, else the Accept header (export)
+# or Content-Type (import), else NDJSON
+def transfer_format(requested, mimetypes):
+    if requested is None:
+        requested = next((name for name, mimetype in FORMATS.items() if mimetype in mimetypes), "ndjson")
+
+    if requested not in FORMATS:
+        raise TransferValidationError(status_code = 400, error_code = "T101", error_message = "format must be csv or ndjson")
+
+    return requested
+
+
+# A user's lists and cards as CSV or NDJSON, streamed from a server side
+# cursor so the board is never held in memory
+class ExportAPI(Resource):
+    @read_only
+    def get(self):
+        args = transfer_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+        format = transfer_format(args["format"], [mimetype for mimetype, quality in request.accept_mimetypes])
+
+        response = Response(stream_with_context(ENCODERS[format](export_records(user_id))), mimetype = FORMATS[format])
+        response.headers["Content-Disposition"] = f"attachment; filename=kanban-{user_id}.{format}"
+        return response
+
+
+# Import an export into a user's board as new lists and cards. The upload
+# is parsed while it streams in and written in chunked transactions; invalid
+# records are reported by line and skipped.
+class ImportAPI(Resource):
+    def post(self):
+        args = transfer_parser.parse_args()
+        user_id = get_user_id(args.get("user_id", None))
+        format = transfer_format(args["format"], [request.mimetype])
+
+        result = import_records(user_id, DECODERS[format](request.stream),
+                                current_app.config.get("IMPORT_CHUNK_SIZE", 1000))
+
+        return result, 200
+
+
+
+# JSON API
+api_blueprint = Blueprint("api", __name__)
+api = Api(api_blueprint)
+api.representation("application/json")(output_json)
+
+api.add_resource(ListAPI, '/api/list', '/api/list/<int:id>')
+api.add_resource(CardAPI, '/api/card', '/api/card/<int:id>')
+api.add_resource(CardMoveAPI, '/api/card/<int:id>/move')
+api.add_resource(BoardAPI, '/api/board')
+api.add_resource(CardBulkAPI, '/api/cards/bulk')
+api.add_resource(ListCardsAPI, '/api/list/<int:id>/cards')
+api.add_resource(ArchivedCardsAPI, '/api/list/<int:id>/archive')
+api.add_resource(SearchAPI, '/api/search')
+api.add_resource(ChangesAPI, '/api/changes')
+api.add_resource(DeadlinesAPI, '/api/deadlines')
+api.add_resource(ExportAPI, '/api/export')
+api.add_resource(ImportAPI, '/api/import')
@@ -0,0 +1,67 @@
+from app.database import db
+from app.models import Card, archived_cards
+from app.writes import write_coalescer
+from sqlalchemy import select, insert, delete, literal, literal_column
+from datetime import datetime, timedelta
+
+
+# Cold storage of completed cards. Cards completed more than
+# ARCHIVE_AFTER_DAYS days ago are moved from `cards` to `archived_cards`, so
+# the board, the search index and every other query of active cards no
+# longer read them. Their rollups move along with them (see
+# app/migrations.py), the summary counts them as before.
+
+# Columns copied from cards to archived_cards
+ARCHIVED_COLUMNS = [column.name for column in archived_cards.c if column.name != "archived_at"]
+
+
+# Oldest completed cards that are due for the archive. The literal 1 lets
+# SQLite use the partial index on completion times of completed cards.
+def archive_candidates(cutoff, limit):
+    return (
+        select(Card.card_id)
+        .where(Card.completed == literal_column("1"), Card.completed_datetime < cutoff)
+        .order_by(Card.completed_datetime)
+        .limit(limit)
+    )
+
+
+# Move one batch of cards; runs in the caller's transaction and returns the
+# number of cards moved
+def archive_batch(cutoff, batch_size, now=None):
+    if now is None:
+        now = datetime.now()
+
+    card_ids = db.session.scalars(archive_candidates(cutoff, batch_size)).all()
+    if card_ids:
+        cards = Card.__table__
+        db.session.execute(
+            insert(archived_cards).from_select(
+                ARCHIVED_COLUMNS + ["archived_at"],
+                select(*[cards.c[name] for name in ARCHIVED_COLUMNS], literal(now, archived_cards.c.archived_at.type))
+                .where(cards.c.card_id.in_(card_ids))))
+        db.session.execute(delete(cards).where(cards.c.card_id.in_(card_ids)))
+    return len(card_ids)
+
+
+# Archive every card completed more than `days` days ago, `batch_size` cards
+# per transaction so that the write lock is never held for long. Returns the
+# number of cards archived.
+def archive_cards(days, batch_size=500):
+    cutoff = datetime.now() - timedelta(days=days)
+
+    archived = 0
+    while True:
+        moved = write_coalescer.run(lambda: archive_batch(cutoff, batch_size))
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+# One page of the archived cards of a list in card_id order, after the card
+# id `after`; `limit + 1` rows are read to tell whether there is a next page
+def archived_page(list_id, after, limit):
+    stmt = select(archived_cards).where(archived_cards.c.list == list_id).order_by(archived_cards.c.card_id)
+    if after is not None:
+        stmt = stmt.where(archived_cards.c.card_id > after)
+    return db.session.execute(stmt.limit(limit + 1)).all()
@@ -0,0 +1,465 @@
+from a2wsgi import WSGIMiddleware
+from flask import request as flask_request
+from contextlib import asynccontextmanager
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.endpoints import HTTPEndpoint
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Mount
+from werkzeug.exceptions import HTTPException, BadRequest
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_etags, http_date, parse_accept_header
+from app.api import list_serializer, card_serializer, card_serializers, validate_card_fields, validate_card_patch, conditional_update
+from app.api import requested_cursor, stale_cursor_error, too_many_streams_error, wants_stream, change_event, STREAM_HEADERS
+from app.changes import latest_change_query, horizon_query, changes_query, current_rows_queries, entries, StreamSlots
+from app.caching import payload_cache, list_version_query, card_version_query, format_list_etag, format_card_etag, projected_etag, if_match_versions
+from app.charts import chart_cache
+from app.database import db, set_sqlite_pragmas
+from app.models import User, List, Card
+from app.serializers import parse_fields, dumps, json_settings
+from app.validation import ListValidationError, CardValidationError, UserValidationError
+import asyncio
+import json
+from time import monotonic
+
+
+# Async engine for the same database as the Flask app, e.g. sqlite+aiosqlite
+# for sqlite. ASYNC_DATABASE_URL overrides the derived URL.
+def create_engine_for(sync_engine, config):
+    url = sync_engine.url
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+
+    engine = create_async_engine(config.get("ASYNC_DATABASE_URL") or url, **config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    set_sqlite_pragmas(engine.sync_engine, config.get("SQLITE_PRAGMAS", {}))
+    return engine
+
+
+# Same body as flask_restful's JSON representation
+def json_response(data, status_code, headers=None):
+    return Response(dumps(data, **json_settings()) + "\n", status_code, headers, media_type="application/json")
+
+
+def from_flask_response(response):
+    return Response(response.get_data(), response.status_code, dict(response.headers))
+
+
+# Request arguments the way reqparse reads them: query string values,
+# overridden by the fields of a JSON body
+async def request_values(request):
+    values = dict(request.query_params)
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.body()
+        if body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise BadRequest("Failed to decode JSON object")
+            if isinstance(data, dict):
+                values.update(data)
+    return values
+
+
+# If-Match header of a request, parsed like werkzeug's request.if_match
+def if_match(request):
+    return parse_etags(request.headers.get("if-match"))
+
+
+# ?fields= of a request, checked like app.api.requested_fields
+def requested_fields(request, serializer, error, error_code):
+    names = parse_fields(request.query_params.get("fields"))
+    if names is not None:
+        try:
+            serializer.select(names)
+        except KeyError as e:
+            raise error(status_code = 400, error_code = error_code, error_message = f"unknown field {e.args[0]}")
+    return names
+
+
+# Async counterpart of app.caching.conditional_get, sharing its payload cache
+async def conditional_get(request, key, etag, load):
+    if etag is None:
+        return None
+
+    headers = {"ETag": f'"{etag}"'}
+
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = payload_cache.get(key, etag)
+    if entry is None:
+        payload, last_modified = await load()
+        entry = payload_cache.put(key, etag, payload, last_modified)
+
+    if entry[2] is not None:
+        headers["Last-Modified"] = http_date(entry[2])
+
+    return json_response(entry[1], 200, headers)
+
+
+# Async counterpart of a flask_restful Resource. Handlers run inside the
+# Flask app context, so the validation errors of the sync API, and their
+# responses, can be reused unchanged.
+class AsyncResource(HTTPEndpoint):
+    async def dispatch(self):
+        request = Request(self.scope, receive=self.receive)
+        state = request.app.state
+        handler = getattr(self, request.method.lower(), None)
+
+        with state.flask_app.app_context():
+            if handler is None:
+                response = json_response({"message": "The method is not allowed for the requested URL."}, 405)
+            else:
+                try:
+                    response = await handler(request, **request.path_params)
+                except HTTPException as e:
+                    response = from_flask_response(e.get_response())
+
+        await response(self.scope, self.receive, self.send)
+
+    def session(self, request, read_only=False):
+        state = request.app.state
+        return state.read_sessions() if read_only else state.sessions()
+
+
+# Async ListAPI: same routes, payloads and error codes
+class ListAsyncAPI(AsyncResource):
+    async def get(self, request, id): # get a list by id
+        names = requested_fields(request, list_serializer, ListValidationError, "L105")
+        serializer = list_serializer.select(names) if names else list_serializer
+
+        async with self.session(request, read_only=True) as session:
+            async def load():
+                list = await session.get(List, id)
+                if list is None:
+                    raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+                return serializer(list), list.updated_at or list.created_at
+
+            etag = projected_etag(format_list_etag(id, await session.scalar(list_version_query(id))), names)
+            response = await conditional_get(request, ("list", id, names), etag, load)
+
+        if response:
+            return response
+        else:
+            raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+
+    async def post(self, request): # create a list for a user
+        args = await request_values(request)
+        name = args.get("name", None)
+        user_id = args.get("user_id", None)
+
+        if name is None:
+            raise ListValidationError(status_code = 400, error_code = "L101", error_message =  "name is required")
+
+        if user_id is None:
+            raise ListValidationError(status_code = 400, error_code = "L102", error_message =  "user id is required")
+
+        async with self.session(request) as session:
+            user = await session.get(User, user_id)
+
+            if user is None:
+                raise UserValidationError(error_code = "U101", error_message = "User does not exist")
+
+            lists = await session.scalar(select(func.count(List.list_id)).where(List.user == user_id))
+
+            if lists > 4:
+                raise ListValidationError(status_code = 400, error_code = "L103", error_message =  "Cannot create more than 5 lists for a user")
+
+            new_list = List(name=name, user=user_id)
+            session.add(new_list)
+            await session.commit()
+            await session.refresh(new_list)
+
+            return json_response(list_serializer(new_list), 201)
+
+
+    async def put(self, request, id): # update a list by id
+        args = await request_values(request)
+        name = args.get("name", None)
+
+        if name is None:
+            raise ListValidationError(status_code = 400, error_code = "L101", error_message =  "name is required")
+
+        async with self.session(request) as session:
+            list = await session.get(List, id)
+
+            if list is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+            list.name = name
+            await session.commit()
+            await session.refresh(list)
+
+            return json_response(list_serializer(list), 200)
+
+
+    async def patch(self, request, id): # rename a list, if it is still the version of If-Match
+        args = await request_values(request)
+        versions = if_match_versions(if_match(request), format_list_etag, id)
+
+        if args.get("name", None) is None:
+            raise ListValidationError(status_code = 400, error_code = "L101", error_message =  "name is required")
+
+        async with self.session(request) as session:
+            row = (await session.execute(conditional_update(List.__table__, List.list_id, id, {"name": args["name"]}, versions))).first()
+
+            if row is None:
+                if await session.get(List, id) is None:
+                    raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+                raise ListValidationError(status_code = 412, error_code = "L106", error_message =  "List was changed since the version in If-Match")
+
+            await session.commit()
+
+            return json_response(list_serializer(row), 200, {"ETag": f'"{format_list_etag(id, row.row_version)}"'})
+
+
+    async def delete(self, request, id): # delete a list by id
+        async with self.session(request) as session:
+            list = await session.get(List, id)
+
+            if list is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+            await session.delete(list)
+            await session.commit()
+
+        chart_cache.evict(id)
+
+        return json_response({"message": "List has been deleted successfully"}, 200)
+
+
+# Async CardAPI: same routes, payloads and error codes
+class CardAsyncAPI(AsyncResource):
+    async def get(self, request, id): # get a card by id
+        names = requested_fields(request, card_serializer, CardValidationError, "C110")
+        serializer = card_serializers(names)[0]
+
+        async with self.session(request, read_only=True) as session:
+            async def load():
+                card = await session.get(Card, id)
+                if card is None:
+                    raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+                return serializer(card), card.updated_at or card.created_at
+
+            etag = projected_etag(format_card_etag(id, await session.scalar(card_version_query(id))), names)
+            response = await conditional_get(request, ("card", id, names), etag, load)
+
+        if response:
+            return response
+        else:
+            raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+
+
+    async def post(self, request): # create a card for a list
+        card = validate_card_fields(await request_values(request), require_list = True)
+
+        async with self.session(request) as session:
+            list_q = await session.get(List, card["list"])
+
+            if list_q is None:
+                raise ListValidationError(status_code = 404, error_code = "L104", error_message =  "List does not exist")
+
+            new_card = Card(**card)
+            session.add(new_card)
+            await session.commit()
+            await session.refresh(new_card)
+
+            return json_response(card_serializer(new_card), 201)
+
+
+    async def put(self, request, id): # update a card by id
+        values = validate_card_fields(await request_values(request))
+
+        async with self.session(request) as session:
+            card = await session.get(Card, id)
+
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+
+            card.title = values["title"]
+            card.content = values["content"]
+            card.deadline = values["deadline"]
+            card.completed = values["completed"]
+            card.completed_datetime = values["completed_datetime"]
+
+            await session.commit()
+            await session.refresh(card)
+
+            return json_response(card_serializer(card), 200)
+
+
+    async def patch(self, request, id): # update some fields of a card, if it is still the version of If-Match
+        args = await request_values(request)
+        values = validate_card_patch({name: args[name] for name in ("title", "content", "deadline", "completed") if name in args})
+        versions = if_match_versions(if_match(request), format_card_etag, id)
+
+        async with self.session(request) as session:
+            row = (await session.execute(conditional_update(Card.__table__, Card.card_id, id, values, versions))).first()
+
+            if row is None:
+                if await session.get(Card, id) is None:
+                    raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+                raise CardValidationError(status_code = 412, error_code = "C113", error_message =  "Card was changed since the version in If-Match")
+
+            await session.commit()
+
+            return json_response(card_serializer(row), 200, {"ETag": f'"{format_card_etag(id, row.row_version)}"'})
+
+
+    async def delete(self, request, id): # delete a card by id
+        async with self.session(request) as session:
+            card = await session.get(Card, id)
+
+            if card is None:
+                raise CardValidationError(status_code = 404, error_code = "C106", error_message =  "Card does not exist")
+
+            await session.delete(card)
+            await session.commit()
+
+        return json_response({"message": "Card has been deleted successfully"}, 200)
+
+
+# Id of the user logged in with the Flask session cookie of a request, the
+# user flask-login would load
+def session_user_id(flask_app, request):
+    with flask_app.test_request_context(headers={"Cookie": request.headers.get("cookie", "")}):
+        session = flask_app.session_interface.open_session(flask_app, flask_request)
+    user_id = session.get("_user_id") if session else None
+    return int(user_id) if user_id is not None else None
+
+
+def int_argument(request, name, default=None):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+
+
+# SSE response that gives its stream slot back however it ends, client
+# disconnects included
+class ChangeStreamResponse(StreamingResponse):
+    def __init__(self, content, release):
+        super().__init__(content, media_type="text/event-stream", headers=STREAM_HEADERS)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+# Change feed streams of ChangesAPI, polled with asyncio.sleep so an open
+# stream holds no thread; at most CHANGES_MAX_ASYNC_STREAMS per process.
+# Pages (no stream) are left to the Flask resource.
+class ChangesAsyncAPI(AsyncResource):
+    async def get(self, request):
+        accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+        if not wants_stream(int_argument(request, "stream", 0), accept):
+            return request.app.state.wsgi # the Flask app answers as the response
+
+        config = request.app.state.flask_app.config
+        since = requested_cursor(int_argument(request, "since"), request.headers.get("last-event-id"))
+        limit = min(max(int_argument(request, "limit", 100), 1), config.get("CHANGES_PAGE_MAX_LIMIT", 1000))
+
+        # the logged in user's feed only, as get_user_id in app/api.py
+        user_id = session_user_id(request.app.state.flask_app, request)
+        if user_id is None:
+            raise UserValidationError(status_code = 401, error_code = "U103", error_message = "login is required")
+        if int_argument(request, "user_id", user_id) != user_id:
+            raise UserValidationError(status_code = 403, error_code = "U104", error_message = "Cannot access another user's board")
+
+        async with self.session(request, read_only=True) as session:
+            if await session.get(User, user_id) is None: # deleted since it logged in
+                raise UserValidationError(status_code = 401, error_code = "U103", error_message = "login is required")
+
+            if since is None:
+                since = await session.scalar(latest_change_query())
+
+            if since < await session.scalar(horizon_query()):
+                raise stale_cursor_error()
+
+        slots = request.app.state.stream_slots
+        if not slots.acquire(config.get("CHANGES_MAX_ASYNC_STREAMS", 1000)):
+            raise too_many_streams_error()
+
+        return ChangeStreamResponse(self.stream(request, user_id, since, limit), slots.release)
+
+    # Same events as ChangesAPI.stream
+    async def stream(self, request, user_id, since, limit):
+        flask_app = request.app.state.flask_app
+        interval = flask_app.config.get("CHANGES_POLL_INTERVAL", 1)
+        timeout = flask_app.config.get("CHANGES_STREAM_TIMEOUT", 60)
+        heartbeat = flask_app.config.get("CHANGES_HEARTBEAT", 15)
+
+        cursor = since
+        started = last_sent = monotonic()
+        yield f"retry: {int(interval * 1000)}\n\n"
+
+        while True:
+            async with self.session(request, read_only=True) as session:
+                rows = (await session.execute(changes_query(user_id, cursor, limit))).all()
+                current = {kind: (await session.execute(stmt)).all() for kind, stmt in current_rows_queries(rows[:limit]).items()}
+
+            with flask_app.app_context():
+                events = [change_event(entry) for entry in entries(rows[:limit], current, list_serializer, card_serializer)]
+            for event in events:
+                yield event
+            if rows[:limit]:
+                cursor = rows[:limit][-1].change_id
+
+            now = monotonic()
+            if events:
+                last_sent = now
+            elif now - last_sent >= heartbeat:
+                yield ": keepalive\n\n"
+                last_sent = now
+
+            if now - started >= timeout:
+                return
+            if len(rows) <= limit:
+                await asyncio.sleep(interval)
+
+
+# The Flask app as an ASGI app, run in a2wsgi's thread pool
+def wsgi_app(flask_app):
+    return WSGIMiddleware(flask_app, workers=flask_app.config.get("ASGI_WSGI_WORKERS", 10))
+
+
+# ASGI app serving ListAPI and CardAPI natively async and every other route
+# through the Flask app, e.g. `uvicorn asgi:app`
+def create_asgi_app(flask_app):
+    with flask_app.app_context():
+        engine = create_engine_for(db.engine, flask_app.config)
+        read_engine = create_engine_for(db.engines["read"], flask_app.config) if "read" in db.engines else engine
+
+    wsgi = wsgi_app(flask_app)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+
+    app = Starlette(routes=[
+        Route("/api/list", ListAsyncAPI),
+        Route("/api/list/{id:int}", ListAsyncAPI),
+        Route("/api/card", CardAsyncAPI),
+        Route("/api/card/{id:int}", CardAsyncAPI),
+        Route("/api/changes", ChangesAsyncAPI),
+        Mount("/", app=wsgi),
+    ], lifespan=lifespan)
+
+    app.state.flask_app = flask_app
+    app.state.wsgi = wsgi
+    app.state.stream_slots = StreamSlots()
+    app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    app.state.read_sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+    return app
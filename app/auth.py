@@ -0,0 +1,87 @@
+from app.database import db
+from app.models import User
+from collections import OrderedDict
+from flask_login import LoginManager, UserMixin
+from sqlalchemy import select, event
+from time import monotonic
+import threading
+
+
+# Lightweight, detached stand-in for User as current_user. It only carries
+# what the views and templates use, never the password hash.
+class SessionUser(UserMixin):
+    def __init__(self, id, email, name):
+        self.id = id
+        self.email = email
+        self.name = name
+
+
+# Bounded TTL/LRU of session users keyed by id, so flask-login does not query
+# the users table on every request. Changes made through the ORM invalidate
+# the entry right away in this process; other workers pick them up when the
+# TTL runs out.
+class UserCache():
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("USER_CACHE_SIZE", self.max_entries)
+        self.ttl = app.config.get("USER_CACHE_TTL", self.ttl)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user):
+        with self._lock:
+            self._users[user.id] = (monotonic() + self.ttl, user)
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    # user_loader for flask-login
+    def load(self, user_id):
+        user = self.get(user_id)
+        if user is not None:
+            return user
+
+        row = db.session.execute(select(User.id, User.email, User.name).where(User.id == user_id)).first()
+        if row is None:
+            return None
+
+        user = SessionUser(row.id, row.email, row.name)
+        self.put(user)
+        return user
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+login_manager = LoginManager()
+login_manager.login_view = 'web.login'
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    # since the user_id is just the primary key of our user table, use it to look up the (cached) user
+    return user_cache.load(int(user_id))
@@ -0,0 +1,26 @@
+from app.models import List
+from sqlalchemy.orm import selectinload
+
+
+# Load all lists of a user together with their cards in two queries (one for
+# the lists, one SELECT ... IN for the cards of all of them) instead of one
+# lazy list.cards query per list.
+def load_board(user_id):
+    return (
+        List.query
+        .options(selectinload(List.cards))
+        .filter_by(user=user_id)
+        .order_by(List.list_id)
+        .all()
+    )
+
+
+# Some lists of the board with their cards, by list id
+def load_lists(list_ids):
+    lists = (
+        List.query
+        .options(selectinload(List.cards))
+        .filter(List.list_id.in_(list_ids))
+        .all()
+    )
+    return {list.list_id: list for list in lists}
@@ -0,0 +1,148 @@
+from app.database import db
+from app.models import List, Card, list_versions
+from collections import OrderedDict
+from flask import request, make_response
+from sqlalchemy import select
+from werkzeug.http import http_date
+import hashlib
+import threading
+
+
+# Bounded LRU of serialized API payloads. Every entry is stored together with
+# the ETag it was built for; a version bump changes the ETag, so outdated
+# entries are never served and are simply replaced on the next read.
+class PayloadCache():
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("PAYLOAD_CACHE_SIZE", self.max_entries)
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, payload, last_modified):
+        entry = (etag, payload, last_modified)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+payload_cache = PayloadCache()
+
+
+# ETags of lists and cards are built from their row_version, bumped on every
+# write of the row (see app/migrations.py), so they can be checked with a
+# single primary key lookup and without loading any ORM object. The board
+# ETag is built from the per-list version counters, which also change with
+# the cards of the lists. The queries are shared with the async API in
+# app/asgi.py.
+
+def list_version_query(list_id):
+    return select(List.row_version).where(List.list_id == list_id)
+
+
+def card_version_query(card_id):
+    return select(Card.row_version).where(Card.card_id == card_id)
+
+
+def format_list_etag(list_id, version):
+    if version is None:
+        return None
+    return f"list-{list_id}-{version}"
+
+
+def format_card_etag(card_id, version):
+    if version is None:
+        return None
+    return f"card-{card_id}-{version}"
+
+
+def list_etag(list_id):
+    return format_list_etag(list_id, db.session.scalar(list_version_query(list_id)))
+
+
+def card_etag(card_id):
+    return format_card_etag(card_id, db.session.scalar(card_version_query(card_id)))
+
+
+# Row versions an If-Match header accepts for `format_etag(id, version)`,
+# the ETags of ?fields= representations included. None when any version is
+# fine (no header, or *); an empty set when no ETag is for this row.
+def if_match_versions(if_match, format_etag, id):
+    if not if_match or if_match.star_tag:
+        return None
+
+    prefix = format_etag(id, "")
+    versions = set()
+    for etag in if_match.as_set():
+        if etag.startswith(prefix):
+            version = etag[len(prefix):].split("-")[0]
+            if version.isdigit():
+                versions.add(int(version))
+    return versions
+
+
+# A ?fields= selection is another representation of the same version, with
+# its own ETag
+def projected_etag(etag, names):
+    if etag is None or names is None:
+        return etag
+    return f"{etag}-" + hashlib.sha1(",".join(names).encode()).hexdigest()[:8]
+
+
+# (list_id, version) of every list of a user, in list order
+def board_versions(user_id):
+    return db.session.execute(
+        select(list_versions.c.list_id, list_versions.c.version)
+        .join(List, List.list_id == list_versions.c.list_id)
+        .where(List.user == user_id)
+        .order_by(list_versions.c.list_id)
+    ).all()
+
+
+def board_etag(user_id):
+    rows = board_versions(user_id)
+    versions = ",".join(f"{row.list_id}:{row.version}" for row in rows)
+    return f"board-{user_id}-" + hashlib.sha1(versions.encode()).hexdigest()[:16]
+
+
+# Answer a GET from the ETag alone when possible: 304 if the client already
+# has this version, the cached payload if this process built it before, and
+# only otherwise call `load`, which returns the payload and its last
+# modification time. Returns None when there is no ETag, i.e. the resource
+# does not exist, so the caller can raise its usual 404.
+def conditional_get(key, etag, load):
+    if etag is None:
+        return None
+
+    headers = {"ETag": f'"{etag}"'}
+
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+        response.headers.extend(headers)
+        return response
+
+    entry = payload_cache.get(key, etag)
+    if entry is None:
+        payload, last_modified = load()
+        entry = payload_cache.put(key, etag, payload, last_modified)
+
+    if entry[2] is not None:
+        headers["Last-Modified"] = http_date(entry[2])
+
+    return entry[1], 200, headers
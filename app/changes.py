@@ -0,0 +1,135 @@
+from app.database import db
+from app.models import List, Card, changes, changes_horizon
+from app.writes import write_coalescer
+from sqlalchemy import select, delete, update, func
+from datetime import datetime, timedelta
+import threading
+
+
+# Change feed of a user's board. Every insert, update and delete of a list or
+# card, from the pages, the API, bulk writes, imports, moves and the archive
+# job alike, is logged in `changes` by triggers. A client that loaded the
+# board remembers the latest change_id as its cursor and then only fetches
+# the changes after it. Entries older than CHANGES_RETENTION_DAYS are
+# removed by the retention job; a cursor from before them is stale and the
+# client has to load the whole board again.
+
+# The newest change_id, the cursor of a client that just loaded the board
+def latest_change_query():
+    return select(func.coalesce(func.max(changes.c.change_id), 0))
+
+
+# Last change_id removed by the retention job
+def horizon_query():
+    return select(func.coalesce(func.max(changes_horizon.c.change_id), 0)).where(changes_horizon.c.id == 1)
+
+
+def latest_change_id():
+    return db.session.scalar(latest_change_query())
+
+
+def is_stale(cursor):
+    return cursor < db.session.scalar(horizon_query())
+
+
+# Changes of a user after the cursor `since`, oldest first; `limit + 1`
+# rows are read to tell whether there are more
+def changes_query(user_id, since, limit):
+    return (
+        select(changes)
+        .where(changes.c.user_id == user_id, changes.c.change_id > since)
+        .order_by(changes.c.change_id)
+        .limit(limit + 1)
+    )
+
+
+def changes_after(user_id, since, limit):
+    return db.session.execute(changes_query(user_id, since, limit)).all()
+
+
+# Queries of the current state of the lists and cards changed in `rows`, by
+# kind of row. The queries are shared with the async stream in app/asgi.py.
+def current_rows_queries(rows):
+    list_ids = {row.entity_id for row in rows if row.entity == "list" and row.operation in ("insert", "update")}
+    card_ids = {row.entity_id for row in rows if row.entity == "card" and row.operation in ("insert", "update")}
+
+    queries = {}
+    if list_ids:
+        queries["list"] = select(*List.__table__.c).where(List.list_id.in_(list_ids))
+    if card_ids:
+        queries["card"] = select(*Card.__table__.c).where(Card.card_id.in_(card_ids))
+    return queries
+
+
+# The entries of `rows` as dicts, each with the current state of its list or
+# card under "data", from the results of current_rows_queries(); None for
+# rows deleted or archived since
+def entries(rows, current, list_serializer, card_serializer):
+    data = {}
+    for row in current.get("list", ()):
+        data["list", row.list_id] = list_serializer(row)
+    for row in current.get("card", ()):
+        data["card", row.card_id] = card_serializer(row)
+
+    return [dict(row._mapping, data=data.get((row.entity, row.entity_id))) for row in rows]
+
+
+def with_data(rows, list_serializer, card_serializer):
+    current = {kind: db.session.execute(stmt).all() for kind, stmt in current_rows_queries(rows).items()}
+    return entries(rows, current, list_serializer, card_serializer)
+
+
+# Open change streams of a process. Every stream polls the database until
+# it times out, so their number is capped; a request above the cap gets a
+# 503 and its client retries later.
+class StreamSlots():
+    def __init__(self):
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+# Oldest changes logged before `cutoff`, read from the index on changed_at
+def changes_to_compact(cutoff, limit):
+    return (
+        select(changes.c.change_id)
+        .where(changes.c.changed_at < cutoff)
+        .order_by(changes.c.changed_at)
+        .limit(limit)
+    )
+
+
+# Remove one batch of changes older than `cutoff` and move the horizon past
+# them; runs in the caller's transaction and returns the number removed
+def compact_batch(cutoff, batch_size):
+    change_ids = db.session.scalars(changes_to_compact(cutoff, batch_size)).all()
+    if change_ids:
+        db.session.execute(delete(changes).where(changes.c.change_id.in_(change_ids)))
+        db.session.execute(
+            update(changes_horizon)
+            .where(changes_horizon.c.id == 1)
+            .values(change_id=func.max(changes_horizon.c.change_id, max(change_ids))))
+    return len(change_ids)
+
+
+# Remove the changes logged more than `days` days ago, `batch_size` per
+# transaction. Returns the number of changes removed.
+def compact_changes(days, batch_size=1000):
+    cutoff = datetime.now() - timedelta(days=days)
+
+    removed = 0
+    while True:
+        batch = write_coalescer.run(lambda: compact_batch(cutoff, batch_size))
+        removed += batch
+        if batch < batch_size:
+            return removed
@@ -0,0 +1,206 @@
+from collections import OrderedDict, namedtuple
+from concurrent.futures import TimeoutError
+from datetime import datetime, timezone
+from io import BytesIO
+from time import perf_counter
+from app.metrics import metrics
+import hashlib
+import threading
+import logging
+import atexit
+
+
+Chart = namedtuple("Chart", ["digest", "png", "last_modified"])
+
+logger = logging.getLogger(__name__)
+
+
+# A chart only depends on its completion histogram, so the hash of the
+# histogram is used both as cache key and as the ETag of the image.
+def histogram_digest(histogram):
+    data = ";".join(f"{day.isoformat()}={count}" for day, count in histogram.items())
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+# Draw the "tasks completed vs date" bar chart and return it as PNG bytes.
+# Runs inside the render pool, so it only uses the object-oriented Figure API
+# and never touches the global pyplot state.
+def render_chart(days, values):
+    from matplotlib.figure import Figure
+
+    n = len(days)
+    r = range(n)
+
+    width = 0.25
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.bar(r, values, color=["cornflowerblue"],
+           width = width, edgecolor = 'black')
+    ax.set_xlabel("Date of completion")
+    ax.set_ylabel("No. of tasks completed")
+    ax.set_title("No. of tasks completed vs Date of completion")
+
+    max_el = 0
+    if len(values) > 0:
+        max_el = max(values)
+
+    y_ticks_labels = [i for i in range(max_el+1)]
+
+    ax.set_xticks([i + width//2 for i in r], days)
+    ax.set_yticks(y_ticks_labels, y_ticks_labels)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+# render_chart plus the time it took, which is reported to the metrics
+def timed_render_chart(days, values):
+    start = perf_counter()
+    png = render_chart(days, values)
+    return png, perf_counter() - start
+
+
+# Renders charts in a process pool so requests never wait on matplotlib.
+# At most `queue_limit` renders can be pending; when the queue is full new
+# renders are refused instead of piling up behind a burst of summary views.
+class RenderService():
+    def __init__(self, workers=2, queue_limit=16, timeout=2, start_method="spawn"):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.start_method = start_method
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config.get("CHART_RENDER_WORKERS", self.workers)
+        self.queue_limit = app.config.get("CHART_RENDER_QUEUE_LIMIT", self.queue_limit)
+        self.timeout = app.config.get("CHART_RENDER_TIMEOUT", self.timeout)
+        self.start_method = app.config.get("CHART_RENDER_START_METHOD", self.start_method)
+
+    # the pool (and multiprocessing) is only loaded by the first render
+    def _get_executor(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+
+            context = multiprocessing.get_context(self.start_method)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            atexit.register(self._executor.shutdown, wait=False, cancel_futures=True)
+        return self._executor
+
+    # Queue a render and return its future, or None if the queue is full.
+    # Concurrent requests for the same chart share a single render.
+    def submit(self, key, days, values, on_done):
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+
+            if len(self._pending) >= self.queue_limit:
+                return None
+
+            from concurrent.futures.process import BrokenProcessPool
+
+            try:
+                future = self._get_executor().submit(timed_render_chart, days, values)
+            except BrokenProcessPool:
+                logger.warning("chart render pool is broken, restarting it")
+                self._executor = None
+                future = self._get_executor().submit(timed_render_chart, days, values)
+
+            self._pending[key] = future
+
+        def done(future):
+            with self._lock:
+                self._pending.pop(key, None)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                logger.error("chart render failed", exc_info=future.exception())
+                return
+            png, elapsed = future.result()
+            metrics.observe_render(elapsed)
+            on_done(png)
+
+        future.add_done_callback(done)
+        return future
+
+    def render(self, key, days, values, on_done):
+        if self.workers == 0: # render inline, e.g. for local debugging
+            png, elapsed = timed_render_chart(days, values)
+            metrics.observe_render(elapsed)
+            metrics.observe_render_wait(elapsed)
+            on_done(png)
+            return None
+        return self.submit(key, days, values, on_done)
+
+
+# Bounded LRU of rendered charts keyed by list id. Charts of deleted lists are
+# evicted explicitly, stale or rarely viewed ones fall off the end of the LRU.
+class ChartCache():
+    def __init__(self, max_entries=256, renderer=None):
+        self.max_entries = max_entries
+        self.renderer = renderer or RenderService()
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("CHART_CACHE_SIZE", self.max_entries)
+        self.renderer.init_app(app)
+
+    def get(self, list_id):
+        with self._lock:
+            chart = self._charts.get(list_id)
+            if chart is not None:
+                self._charts.move_to_end(list_id)
+            return chart
+
+    def put(self, list_id, chart):
+        with self._lock:
+            self._charts[list_id] = chart
+            self._charts.move_to_end(list_id)
+            while len(self._charts) > self.max_entries:
+                self._charts.popitem(last=False)
+
+    def evict(self, list_id):
+        with self._lock:
+            self._charts.pop(list_id, None)
+
+    # Return the cached chart for this histogram if it is up to date.
+    # Otherwise queue a render in the background and return None right away,
+    # or with `wait` set, wait up to the render timeout for it.
+    def chart_for(self, list_id, histogram, wait=False):
+        digest = histogram_digest(histogram)
+        chart = self.get(list_id)
+
+        if chart is not None and chart.digest == digest:
+            return chart
+
+        def store(png):
+            self.put(list_id, Chart(digest, png, datetime.now(timezone.utc).replace(microsecond=0)))
+
+        days = [day.isoformat() for day in histogram.keys()]
+        future = self.renderer.render((list_id, digest), days, list(histogram.values()), store)
+
+        if wait and future is not None:
+            start = perf_counter()
+            try:
+                store(future.result(timeout=self.renderer.timeout)[0])
+            except TimeoutError:
+                return None
+            except Exception:
+                return None # already logged by the render service
+            finally:
+                metrics.observe_render_wait(perf_counter() - start)
+
+        chart = self.get(list_id)
+        if chart is not None and chart.digest == digest:
+            return chart
+        return None
+
+
+chart_cache = ChartCache()
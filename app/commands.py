@@ -0,0 +1,150 @@
+from flask.cli import AppGroup
+from app.database import db
+from app.models import User
+from app import migrations, summary, search, deadlines, transfer, ranks, archive, changes
+from flask import current_app
+from datetime import datetime
+import click
+
+
+db_cli = AppGroup("db", help="Manage the kanban database schema.")
+
+jobs_cli = AppGroup("jobs", help="Batch jobs, meant to be run from cron.")
+
+board_cli = AppGroup("board", help="Export and import boards.")
+
+
+@db_cli.command("upgrade")
+@click.option("--target", type=int, default=None, help="Stop at this schema version.")
+def db_upgrade(target):
+    """Apply pending schema migrations."""
+    applied = migrations.upgrade(db.engine, target)
+    for migration in applied:
+        click.echo(f"applied {migration.version}: {migration.name}")
+    click.echo(f"schema version {migrations.current_version(db.engine)}")
+
+
+@db_cli.command("version")
+def db_version():
+    """Show the current schema version."""
+    click.echo(migrations.current_version(db.engine))
+
+
+@db_cli.command("explain")
+def db_explain():
+    """Show EXPLAIN QUERY PLAN for the hot queries."""
+    for name, plan in migrations.explain(db.engine).items():
+        click.echo(f"{name}:")
+        for detail in plan:
+            click.echo(f"  {detail}")
+
+
+@db_cli.command("verify-rollups")
+@click.option("--rebuild", is_flag=True, help="Recompute the rollups from the cards when they drifted.")
+def db_verify_rollups(rebuild):
+    """Check the summary rollups against a recount of the cards."""
+    drift = summary.verify_rollups()
+    for list_id, field, expected, actual in drift:
+        click.echo(f"list {list_id} {field}: expected {expected}, found {actual}")
+
+    if not drift:
+        click.echo("rollups are up to date")
+        return
+
+    if not rebuild:
+        raise click.ClickException(f"{len(drift)} rollup values drifted, run with --rebuild to fix them")
+
+    summary.rebuild_rollups()
+    click.echo("rollups rebuilt")
+
+
+@db_cli.command("rebuild-rollups")
+def db_rebuild_rollups():
+    """Recompute the summary rollups from the cards."""
+    summary.rebuild_rollups()
+    click.echo("rollups rebuilt")
+
+
+@db_cli.command("rebuild-search")
+def db_rebuild_search():
+    """Index all cards for full-text search from scratch."""
+    search.rebuild_index()
+    search.check_index()
+    click.echo("search index rebuilt")
+
+
+@db_cli.command("rebalance-ranks")
+@click.option("--list", "list_id", type=int, default=None, help="Rebalance this list only, even if it does not need it.")
+def db_rebalance_ranks(list_id):
+    """Respace the card ranks of lists whose ranks got too long or collide."""
+    list_ids = [list_id] if list_id is not None else ranks.lists_to_rebalance(ranks.rebalancer.max_length)
+    for list_id in list_ids:
+        cards = ranks.rebalance(list_id)
+        db.session.commit()
+        click.echo(f"list {list_id}: {cards} cards")
+    click.echo(f"{len(list_ids)} lists rebalanced")
+
+
+@jobs_cli.command("deadline-digest")
+@click.option("--day", default=None, help="Digest day as YYYY-MM-DD, today by default.")
+@click.option("--days", type=int, default=None, help="Include cards due within this many days.")
+def jobs_deadline_digest(day, days):
+    """Write the daily digest of overdue and due soon cards of every user."""
+    day = datetime.strptime(day, "%Y-%m-%d").date() if day else None
+    if days is None:
+        days = current_app.config.get("DEADLINE_SOON_DAYS", 3)
+
+    written = deadlines.build_digests(day, days, current_app.config.get("DIGEST_MAX_CARDS", 20))
+    click.echo(f"{written} digests written")
+
+
+@jobs_cli.command("archive-cards")
+@click.option("--days", type=int, default=None, help="Archive cards completed more than this many days ago.")
+@click.option("--batch-size", type=int, default=None, help="Cards moved per transaction.")
+def jobs_archive_cards(days, batch_size):
+    """Move long completed cards to the archive."""
+    if days is None:
+        days = current_app.config.get("ARCHIVE_AFTER_DAYS", 90)
+    if batch_size is None:
+        batch_size = current_app.config.get("ARCHIVE_BATCH_SIZE", 500)
+
+    archived = archive.archive_cards(days, batch_size)
+    click.echo(f"{archived} cards archived")
+
+
+@jobs_cli.command("compact-changes")
+@click.option("--days", type=int, default=None, help="Remove changes logged more than this many days ago.")
+@click.option("--batch-size", type=int, default=1000, help="Changes removed per transaction.")
+def jobs_compact_changes(days, batch_size):
+    """Remove old entries of the change log."""
+    if days is None:
+        days = current_app.config.get("CHANGES_RETENTION_DAYS", 7)
+
+    removed = changes.compact_changes(days, batch_size)
+    click.echo(f"{removed} changes removed")
+
+
+@board_cli.command("export")
+@click.argument("user_id", type=int)
+@click.argument("output", type=click.File("w"), default="-")
+@click.option("--format", "format", type=click.Choice(list(transfer.FORMATS)), default="ndjson")
+def board_export(user_id, output, format):
+    """Export the lists and cards of a user to OUTPUT (stdout by default)."""
+    for chunk in transfer.ENCODERS[format](transfer.export_records(user_id)):
+        output.write(chunk)
+
+
+@board_cli.command("import")
+@click.argument("user_id", type=int)
+@click.argument("input", type=click.File("rb"), default="-")
+@click.option("--format", "format", type=click.Choice(list(transfer.FORMATS)), default="ndjson")
+def board_import(user_id, input, format):
+    """Import an export from INPUT (stdin by default) as new lists and cards of a user."""
+    if db.session.get(User, user_id) is None:
+        raise click.ClickException(f"user {user_id} does not exist")
+
+    result = transfer.import_records(user_id, transfer.DECODERS[format](input),
+                                     current_app.config.get("IMPORT_CHUNK_SIZE", 1000))
+    for error in result["errors"]:
+        click.echo(f"line {error['line']}: {error['error_code']} {error['error_message']}", err=True)
+    click.echo(f"{result['lists']} lists and {result['cards']} cards imported, {result['failed']} records skipped")
@@ -1,10 +1,146 @@
+import os
+
+
 class Config():
     DEBUG = False
+    SERVE_WEB = True
+    SERVE_API = True
     SQLALCHEMY_DATABASE_URI = None
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = {}
+    AUTO_MIGRATE = False
+    CHART_CACHE_SIZE = 256
+    CHART_RENDER_WORKERS = 2
+    CHART_RENDER_QUEUE_LIMIT = 16
+    CHART_RENDER_TIMEOUT = 2
+    PAYLOAD_CACHE_SIZE = 1024
+    FRAGMENT_CACHE = "memory"
+    FRAGMENT_CACHE_SIZE = 256
+    FRAGMENT_CACHE_PATH = None
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60
+    BULK_MAX_OPERATIONS = 10000
+    RANK_MAX_LENGTH = 32
+    GROUP_COMMIT = False
+    GROUP_COMMIT_WINDOW_MS = 2
+    GROUP_COMMIT_MAX_BATCH = 100
+    GROUP_COMMIT_TIMEOUT = 10
+    CARD_PAGE_MAX_LIMIT = 1000
+    SEARCH_MAX_LIMIT = 100
+    DEADLINE_SOON_DAYS = 3
+    DIGEST_MAX_CARDS = 20
+    IMPORT_CHUNK_SIZE = 1000
+    ARCHIVE_AFTER_DAYS = 90
+    ARCHIVE_BATCH_SIZE = 500
+    ARCHIVE_PAGE_MAX_LIMIT = 1000
+    CHANGES_PAGE_MAX_LIMIT = 1000
+    CHANGES_RETENTION_DAYS = 7
+    CHANGES_POLL_INTERVAL = 1
+    CHANGES_HEARTBEAT = 15
+    CHANGES_STREAM_TIMEOUT = 60
+    CHANGES_MAX_STREAMS = 4
+    CHANGES_MAX_ASYNC_STREAMS = 1000
+    METRICS_ENABLED = False
+    SERVER_TIMING_HEADER = False
+    SLOW_QUERY_THRESHOLD_MS = 100
+    ASYNC_DATABASE_URL = None
+    ASGI_WSGI_WORKERS = 10
+    JSON_BACKEND = "json"
+    REQUIRED_SETTINGS = ()
+
+    # The config class to use in an environment, see ProductionConfig
+    @classmethod
+    def from_environ(cls, environ):
+        return cls
 
 
 class LocalDevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///kanban_db.sqlite3'
     DEBUG = True
-    SECRET_KEY = 'secret-key-for-session'
\ No newline at end of file
+    AUTO_MIGRATE = True
+    SECRET_KEY = 'secret-key-for-session'
+
+
+class ProductionConfig(Config):
+    # create_app refuses to start without it instead of failing at the first login
+    REQUIRED_SETTINGS = ('SECRET_KEY',)
+
+    # Settings read from the environment, when get_config() is called rather
+    # than when this module is imported
+    @classmethod
+    def from_environ(cls, environ):
+        database_url = environ.get('DATABASE_URL', 'sqlite:///kanban_db.sqlite3')
+
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': database_url,
+            'SECRET_KEY': environ.get('SECRET_KEY'),
+
+            # WAL lets readers run next to the single writer, and busy_timeout
+            # makes writers wait for the lock instead of failing with
+            # "database is locked"
+            'SQLITE_PRAGMAS': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+                'cache_size': -64000, # 64 MB
+                'mmap_size': 268435456, # 256 MB
+            },
+
+            'SQLALCHEMY_ENGINE_OPTIONS': {
+                'pool_size': int(environ.get('DATABASE_POOL_SIZE', 5)),
+                'max_overflow': int(environ.get('DATABASE_MAX_OVERFLOW', 10)),
+                'pool_recycle': int(environ.get('DATABASE_POOL_RECYCLE', 3600)),
+                'pool_pre_ping': True,
+            },
+
+            # Read-only routes use their own connection pool, on a replica when
+            # READ_DATABASE_URL is set and on the main database otherwise
+            'SQLALCHEMY_BINDS': {
+                'read': environ.get('READ_DATABASE_URL', database_url),
+            },
+
+            # async driver URL for the ASGI API, derived from DATABASE_URL by default
+            'ASYNC_DATABASE_URL': environ.get('ASYNC_DATABASE_URL'),
+
+            # workers can be dedicated to the HTML pages or to the JSON API
+            'SERVE_WEB': environ.get('SERVE_WEB', '1') == '1',
+            'SERVE_API': environ.get('SERVE_API', '1') == '1',
+
+            # commit concurrent card and list writes together, see app/writes.py
+            'GROUP_COMMIT': environ.get('GROUP_COMMIT', '0') == '1',
+            'GROUP_COMMIT_WINDOW_MS': float(environ.get('GROUP_COMMIT_WINDOW_MS', 2)),
+            'GROUP_COMMIT_MAX_BATCH': int(environ.get('GROUP_COMMIT_MAX_BATCH', 100)),
+            'GROUP_COMMIT_TIMEOUT': float(environ.get('GROUP_COMMIT_TIMEOUT', 10)),
+
+            # rendered lists of the home page: "memory", "sqlite" (one file
+            # shared by the workers of a machine) or "none"
+            'FRAGMENT_CACHE': environ.get('FRAGMENT_CACHE', 'memory'),
+            'FRAGMENT_CACHE_PATH': environ.get('FRAGMENT_CACHE_PATH'),
+
+            # "orjson" for faster, compact JSON responses when orjson is installed
+            'JSON_BACKEND': environ.get('JSON_BACKEND', 'json'),
+
+            # completed cards older than this many days are archived by the archive job
+            'ARCHIVE_AFTER_DAYS': int(environ.get('ARCHIVE_AFTER_DAYS', 90)),
+
+            # changes older than this many days are removed by the retention
+            # job; clients that were offline for longer load the whole board again
+            'CHANGES_RETENTION_DAYS': int(environ.get('CHANGES_RETENTION_DAYS', 7)),
+
+            'METRICS_ENABLED': environ.get('METRICS_ENABLED', '0') == '1',
+            'SERVER_TIMING_HEADER': environ.get('SERVER_TIMING_HEADER', '0') == '1',
+        }
+
+        return type(cls.__name__, (cls,), settings)
+
+
+configs = {
+    'development': LocalDevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+
+# Config class selected by the KANBAN_ENV environment variable, with the
+# settings it reads from the environment as it is now
+def get_config():
+    return configs[os.environ.get('KANBAN_ENV', 'development')].from_environ(os.environ)
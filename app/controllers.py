@@ -1,86 +1,81 @@
-from flask import render_template, request, redirect, url_for
-from flask import current_app as app
-from app.database import db
+from flask import render_template, request, redirect, url_for, send_file, abort, make_response, Blueprint
+from app.database import db, read_only
 from app.models import User, List, Card
 from datetime import datetime
+from app.board import load_lists
+from app.caching import board_versions
+from app.fragments import fragment_cache
+from app.summary import summary_counts
+from app.charts import chart_cache
+from app.writes import write_coalescer
+from app.ranks import rank_after, last_rank
 from app.forms import RegisterForm, LoginForm, AddListForm, EditListForm, AddCardForm, EditCardForm
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, login_required, current_user, logout_user
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
+from io import BytesIO
+
+
+# HTML pages
+web = Blueprint("web", __name__)
 
 
 # home route
-@app.route("/", methods=["GET", "POST"])
+@web.route("/", methods=["GET", "POST"])
+@read_only
 @login_required
 def home():
     user_id = current_user.id
-    lists = List.query.filter_by(user=user_id).all()
+
+    # every list is rendered once per version; only the lists that changed
+    # since they were cached are loaded, with their cards
+    def load(list_ids):
+        return {list_id: {"list": list} for list_id, list in load_lists(list_ids).items()}
+
+    lists = fragment_cache.render_all("list.html", board_versions(user_id), load)
     return render_template('home.html', title="Kanban - Home", lists=lists)
 
 
 # summary route
-@app.route("/summary", methods=["GET", "POST"])
+@web.route("/summary", methods=["GET", "POST"])
+@read_only
 @login_required
 def summary():
     user_id = current_user.id
     lists = List.query.filter_by(user=user_id).all()
-    counts = {}
-    today = datetime.today().date()
+    counts = summary_counts(user_id)
     for list in lists:
-        date_count = []
-        d = {}
-        counts[list.list_id] = {"total": len(
-            list.cards), "total_completed": 0, "total_incomplete": 0, "d_passed": 0, "date_count": None}
-        for card in list.cards:
-            if card.completed == 1:
-                counts[list.list_id]["total_completed"] += 1 # calculate how many tasks are completed
-                date_count.append(card.completed_datetime.date())
-            else:
-                counts[list.list_id]["total_incomplete"] += 1 # calculate how many tasks are incomplete
-                if today > card.deadline:
-                    counts[list.list_id]["d_passed"] += 1 # Out of the total incomplete tasks, calculate how many have passed the deadline
-
-        for i in date_count:
-            if i in d.keys():
-                d[i] +=1
-            else:
-                d[i] = 1
-        
-
-        n=len(d.keys())
-        r = np.arange(n)
-       
-        width = 0.25
-
-        plt.clf()
-        plt.bar(r, d.values(), color=["cornflowerblue"],
-                width = width, edgecolor = 'black')
-        plt.xlabel("Date of completion")
-        plt.ylabel("No. of tasks completed")
-        plt.title("No. of tasks completed vs Date of completion")
-
-        max_el = 0
-        if len(d.values()) > 0:
-            max_el = max(d.values())
-        
-        y_ticks_labels = [i for i in range(max_el+1)]
-
-        plt.xticks(r+width//2, d.keys())
-        plt.yticks(y_ticks_labels, y_ticks_labels)
-
-        if len(date_count) > 0:
-            plt.savefig(f'static/png/{list.list_id}.png')
-        
-        counts[list.list_id]["date_count"] = date_count
+        histogram = counts[list.list_id]["histogram"]
+        if len(histogram) > 0:
+            chart_cache.chart_for(list.list_id, histogram) # queues a render if the histogram changed, never waits
 
     return render_template("summary.html", title="Kanban - Summary", lists=lists, counts=counts)
 
 
+# summary chart route
+@web.route("/summary/chart/<int:list_id>.png", methods=["GET"])
+@read_only
+@login_required
+def summary_chart(list_id):
+    counts = summary_counts(current_user.id, list_id=list_id)
+
+    if list_id not in counts or len(counts[list_id]["histogram"]) == 0:
+        abort(404)
+
+    chart = chart_cache.chart_for(list_id, counts[list_id]["histogram"], wait=True)
+
+    if chart is None: # render queue is full or the render is still running
+        response = make_response("Chart is being rendered", 503)
+        response.headers["Retry-After"] = "1"
+        return response
+
+    response = send_file(BytesIO(chart.png), mimetype="image/png", etag=chart.digest,
+                         last_modified=chart.last_modified, conditional=True)
+    response.cache_control.no_cache = True
+    return response
+
+
 # register route
-@app.route("/register", methods=["GET", "POST"])
+@web.route("/register", methods=["GET", "POST"])
 def register():
     form = RegisterForm(meta={'csrf': False})
 
@@ -95,7 +90,7 @@ def register():
             check_user = User.query.filter_by(email=email).first()
 
             if check_user:
-                return render_template("error.html", message="User already exists with this email address!", form=form, extras="Sign in", name="login")
+                return render_template("error.html", message="User already exists with this email address!", form=form, extras="Sign in", name="web.login")
 
             hashed = generate_password_hash(password, method='sha256')
             new_user = User(email=email, name = name, password=hashed)
@@ -106,13 +101,13 @@ def register():
             print(new_user.created_at)
             print(new_user.updated_at)
 
-            return redirect(url_for('login'))
+            return redirect(url_for('web.login'))
         else:
-            return render_template("error.html", message = "", form=form, extras="Go back", name="register")
+            return render_template("error.html", message = "", form=form, extras="Go back", name="web.register")
 
 
 # login route
-@app.route("/login", methods=["GET", "POST"])
+@web.route("/login", methods=["GET", "POST"])
 def login():
     form = LoginForm(meta={'csrf': False})
 
@@ -127,34 +122,34 @@ def login():
             user = User.query.filter_by(email=email).first()
 
             if not user:
-                return render_template("error.html", message="Incorrect email or password", form=form, extras="Retry", name="login")
+                return render_template("error.html", message="Incorrect email or password", form=form, extras="Retry", name="web.login")
 
             hashed = user.password
 
             check_password = check_password_hash(hashed, password)
 
             if not check_password:
-                return render_template("error.html", message="Incorrect email or password", form=form, extras="Retry", name="login")
+                return render_template("error.html", message="Incorrect email or password", form=form, extras="Retry", name="web.login")
             
             login_user(user)
 
-            return redirect(url_for("home"))
+            return redirect(url_for("web.home"))
         else:
-            return render_template("error.html", message="", form=form, extras="Go back", name="login")
+            return render_template("error.html", message="", form=form, extras="Go back", name="web.login")
 
 
 
 # logout route
-@app.route("/logout", methods=["GET"])
+@web.route("/logout", methods=["GET"])
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for("login"))
+    return redirect(url_for("web.login"))
 
 
 
 # add list route
-@app.route("/list/add", methods=["GET", "POST"])
+@web.route("/list/add", methods=["GET", "POST"])
 @login_required
 def add_list():
     form = AddListForm(meta={'csrf': False})
@@ -167,22 +162,26 @@ def add_list():
 
             user_id = current_user.id
 
-            lists = List.query.filter_by(user=user_id).all()
+            def create():
+                lists = List.query.filter_by(user=user_id).all()
 
-            if len(lists) > 4:
-                return render_template("error.html", message="Cannot create more than 5 lists!", form=form, extras="Go back", name="home")
+                if len(lists) > 4:
+                    return False
 
-            new_list = List(name=name, user=user_id)
-            db.session.add(new_list)
-            db.session.commit()
+                new_list = List(name=name, user=user_id)
+                db.session.add(new_list)
+                return True
 
-            return redirect(url_for('home'))
+            if not write_coalescer.run(create):
+                return render_template("error.html", message="Cannot create more than 5 lists!", form=form, extras="Go back", name="web.home")
+
+            return redirect(url_for('web.home'))
         else:
-            return render_template("error.html", message="", form=form, extras="Go back", name="add_list")
+            return render_template("error.html", message="", form=form, extras="Go back", name="web.add_list")
 
 
 # edit list route
-@app.route("/list/edit/<int:list_id>", methods=["GET", "POST"])
+@web.route("/list/edit/<int:list_id>", methods=["GET", "POST"])
 @login_required
 def edit_list(list_id):
     form = EditListForm(meta={'csrf': False})
@@ -195,33 +194,38 @@ def edit_list(list_id):
         if form.validate_on_submit():
             name = form.name.data
     
-            list = List.query.get(list_id)
+            def update():
+                list = List.query.get(list_id)
 
-            list.name = name
+                list.name = name
 
-            db.session.add(list)
-            db.session.commit()
+                db.session.add(list)
+
+            write_coalescer.run(update)
 
-            return redirect(url_for('home'))
+            return redirect(url_for('web.home'))
         else:
-            return render_template("error.html", message="", form=form, extras="Go back", name="home")
+            return render_template("error.html", message="", form=form, extras="Go back", name="web.home")
 
 
 
 # delete list route
-@app.route("/list/delete/<int:list_id>", methods=["GET"])
+@web.route("/list/delete/<int:list_id>", methods=["GET"])
 @login_required
 def delete_list(list_id):
-    list = List.query.get(list_id)
+    def remove():
+        list = List.query.get(list_id)
+
+        db.session.delete(list)
 
-    db.session.delete(list)
-    db.session.commit()
+    write_coalescer.run(remove)
+    chart_cache.evict(list_id)
 
-    return redirect(url_for("home"))
+    return redirect(url_for("web.home"))
 
 
 # add card route
-@app.route("/card/add/<int:list_id>", methods=["GET", "POST"])
+@web.route("/card/add/<int:list_id>", methods=["GET", "POST"])
 @login_required
 def add_card(list_id):
     form = AddCardForm(meta={'csrf': False}, completed=0)
@@ -241,20 +245,22 @@ def add_card(list_id):
             if form.completed.data == '1':
                 completed_datetime = datetime.now()
 
-            new_card = Card(title=title, content=content,
-                            deadline=deadline, completed=completed, completed_datetime=completed_datetime, list=list_id)
+            def create():
+                new_card = Card(title=title, content=content,
+                                deadline=deadline, completed=completed, completed_datetime=completed_datetime, list=list_id)
 
-            db.session.add(new_card)
-            db.session.commit()
+                db.session.add(new_card)
 
-            return redirect(url_for("home"))
+            write_coalescer.run(create)
+
+            return redirect(url_for("web.home"))
         else:
-            return render_template("error.html", message="", form=form, extras="Go back", name="home")
+            return render_template("error.html", message="", form=form, extras="Go back", name="web.home")
 
 
 
 # edit card route
-@app.route("/card/edit/<int:card_id>", methods=["GET", "POST"])
+@web.route("/card/edit/<int:card_id>", methods=["GET", "POST"])
 @login_required
 def edit_card(card_id):
     user_id = current_user.id
@@ -283,28 +289,36 @@ def edit_card(card_id):
             if form.completed.data == '1':
                 completed_datetime = datetime.now()
 
-            card.title = title
-            card.content = content
-            card.deadline = deadline
-            card.completed = completed
-            card.completed_datetime = completed_datetime
-            card.list = list_id
+            def update():
+                card = Card.query.get(card_id)
 
-            db.session.add(card)
-            db.session.commit()
+                card.title = title
+                card.content = content
+                card.deadline = deadline
+                card.completed = completed
+                card.completed_datetime = completed_datetime
+                if card.list != int(list_id): # moved to the end of the other list
+                    card.rank = rank_after(last_rank(list_id))
+                card.list = list_id
+
+                db.session.add(card)
 
-            return redirect(url_for("home"))
+            write_coalescer.run(update)
+
+            return redirect(url_for("web.home"))
         else:
-            return render_template("error.html", message="", form=form, extras="Go back", name="home")
+            return render_template("error.html", message="", form=form, extras="Go back", name="web.home")
 
 
 # delete card route
-@app.route("/card/delete/<int:card_id>", methods=["GET"])
+@web.route("/card/delete/<int:card_id>", methods=["GET"])
 @login_required
 def delete_card(card_id):
-    card = Card.query.get(card_id)
+    def remove():
+        card = Card.query.get(card_id)
+
+        db.session.delete(card)
 
-    db.session.delete(card)
-    db.session.commit()
+    write_coalescer.run(remove)
 
-    return redirect(url_for("home"))
\ No newline at end of file
+    return redirect(url_for("web.home"))
\ No newline at end of file
@@ -1,6 +1,44 @@
+from flask import request, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
+from functools import wraps
+
+
+# Session that sends the queries of read-only routes to the "read" bind when
+# one is configured. Flushes and INSERT/UPDATE/DELETE statements always go
+# to the default (write) engine.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context() and request.environ.get("kanban.read_only", False)
+                and not getattr(clause, "is_dml", False) and "read" in self._db.engines):
+            return self._db.engines["read"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Mark a view as read-only so its queries can use the read pool or replica
+def read_only(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        request.environ["kanban.read_only"] = True
+        return f(*args, **kwargs)
+    return decorated
+
+
+# Run the configured PRAGMAs on every new SQLite connection of an engine
+def set_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
 
 engine = None
 Base = declarative_base()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
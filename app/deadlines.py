@@ -0,0 +1,72 @@
+from app.database import db
+from app.models import List, Card, deadline_digests
+from sqlalchemy import select, delete, insert
+from datetime import datetime, timedelta
+from itertools import groupby
+import json
+
+
+# Incomplete cards of a user that are overdue or due within `days` days,
+# soonest deadline first. Served by the partial index on (list, deadline)
+# of incomplete cards, so completed cards are never read.
+def deadline_query(user_id, today, days):
+    return (
+        select(*Card.__table__.c, List.name.label("list_name"))
+        .join(List, List.list_id == Card.list)
+        .where(List.user == user_id, Card.completed != 1, Card.deadline <= today + timedelta(days=days))
+        .order_by(Card.deadline, Card.card_id)
+    )
+
+
+def due_cards(user_id, days, limit, today=None):
+    if today is None:
+        today = datetime.today().date()
+    return db.session.execute(deadline_query(user_id, today, days).limit(limit)).all()
+
+
+# Every user's overdue and due soon cards in one ordered pass over the
+# partial index, grouped by user
+def digest_query(today, days):
+    return (
+        select(List.user, Card.card_id, Card.title, Card.list, Card.deadline)
+        .join(Card, Card.list == List.list_id)
+        .where(Card.completed != 1, Card.deadline <= today + timedelta(days=days))
+        .order_by(List.user)
+    )
+
+
+def digest_record(user_id, rows, day, max_items):
+    rows = sorted(rows, key=lambda row: (row.deadline, row.card_id))
+    overdue = sum(1 for row in rows if row.deadline < day)
+    items = [{"card_id": row.card_id, "title": row.title, "list": row.list, "deadline": row.deadline.isoformat()}
+             for row in rows[:max_items]]
+    return {"user_id": user_id, "day": day, "overdue": overdue, "due_soon": len(rows) - overdue,
+            "cards": json.dumps(items), "created_at": datetime.now()}
+
+
+# Write the digest of `day` for every user with overdue or due soon cards:
+# rows are streamed from a server side cursor and the digests inserted in
+# batches, all in one transaction that replaces an earlier run for the same
+# day. Returns the number of digests written.
+def build_digests(day=None, days=3, max_items=20, batch_size=1000):
+    if day is None:
+        day = datetime.today().date()
+
+    written = 0
+    with db.engine.begin() as connection:
+        connection.execute(delete(deadline_digests).where(deadline_digests.c.day == day))
+
+        batch = []
+        result = connection.execute(digest_query(day, days).execution_options(yield_per=5000))
+        for user_id, rows in groupby(result, key=lambda row: row.user):
+            batch.append(digest_record(user_id, rows, day, max_items))
+            if len(batch) >= batch_size:
+                connection.execute(insert(deadline_digests), batch)
+                written += len(batch)
+                batch = []
+
+        if batch:
+            connection.execute(insert(deadline_digests), batch)
+            written += len(batch)
+
+    return written
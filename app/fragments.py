@@ -0,0 +1,153 @@
+from app.database import db
+from app.models import database_identity
+from collections import OrderedDict
+from sqlalchemy import select
+from flask import current_app, request, render_template
+from markupsafe import Markup
+import hashlib
+import os
+import sqlite3
+import threading
+
+
+# Stores of rendered HTML fragments. Like the payload cache, every entry is
+# kept together with the version it was rendered for and only served for
+# that version; a newer version simply replaces it.
+
+# Bounded LRU in the memory of the process
+class MemoryFragmentStore():
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, html):
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Local SQLite file, shared by the workers of one machine and kept across
+# restarts. The store is only a cache: any SQLite error is a miss.
+class SqliteFragmentStore():
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("CREATE TABLE IF NOT EXISTS fragments (key TEXT PRIMARY KEY, version TEXT NOT NULL, html TEXT NOT NULL)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, version):
+        try:
+            row = self.connection().execute("SELECT html FROM fragments WHERE key = ? AND version = ?", (key, version)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def put(self, key, version, html):
+        try:
+            self.connection().execute("INSERT OR REPLACE INTO fragments (key, version, html) VALUES (?, ?, ?)", (key, version, html))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            self.connection().execute("DELETE FROM fragments")
+        except sqlite3.Error:
+            pass
+
+
+# Rendered template fragments keyed on an object and its version, e.g. a list
+# of the board and its list_versions counter. FRAGMENT_CACHE selects the
+# store: "memory" (default), "sqlite" (FRAGMENT_CACHE_PATH, in the instance
+# folder by default) or "none". Versions are qualified with the identity of
+# the database, so a store kept across restarts never serves fragments of
+# another database that reached the same counters.
+class FragmentCache():
+    def __init__(self):
+        self.store = MemoryFragmentStore()
+        self._digests = {}
+        self._identity = None
+
+    def init_app(self, app):
+        self._identity = None
+        backend = app.config.get("FRAGMENT_CACHE", "memory")
+        if backend == "memory":
+            self.store = MemoryFragmentStore(app.config.get("FRAGMENT_CACHE_SIZE", 256))
+        elif backend == "sqlite":
+            path = app.config.get("FRAGMENT_CACHE_PATH") or os.path.join(app.instance_path, "fragments.sqlite3")
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.store = SqliteFragmentStore(path)
+        elif backend == "none":
+            self.store = None
+        else:
+            raise ValueError(f"unknown FRAGMENT_CACHE {backend!r}")
+
+    # Fingerprint of a template's source, so that a deploy with a changed
+    # template never serves fragments rendered from the old one
+    def template_digest(self, name):
+        digest = self._digests.get(name)
+        if digest is None or current_app.debug:
+            env = current_app.jinja_env
+            source = env.loader.get_source(env, name)[0]
+            digest = self._digests[name] = hashlib.sha1(source.encode()).hexdigest()[:12]
+        return digest
+
+    # Token of the database, read once per process
+    def database_identity(self):
+        if self._identity is None:
+            self._identity = db.session.scalar(select(database_identity.c.token).where(database_identity.c.id == 1)) or ""
+        return self._identity
+
+    # The fragment of `template` for every (key, version) pair, in order.
+    # `load` is called once with the keys that are not cached and returns
+    # {key: template context}; those are rendered and stored.
+    def render_all(self, template, items, load):
+        prefix = f"{template}:{request.script_root}:"
+        digest = f"{self.template_digest(template)}:{self.database_identity()}"
+
+        fragments = {}
+        if self.store is not None:
+            for key, version in items:
+                html = self.store.get(prefix + str(key), f"{version}:{digest}")
+                if html is not None:
+                    fragments[key] = Markup(html)
+
+        missing = [key for key, version in items if key not in fragments]
+        if missing:
+            versions = dict(items)
+            for key, context in load(missing).items():
+                html = render_template(template, **context)
+                if self.store is not None:
+                    self.store.put(prefix + str(key), f"{versions[key]}:{digest}", html)
+                fragments[key] = Markup(html)
+
+        return [fragments[key] for key, version in items if key in fragments]
+
+    def clear(self):
+        if self.store is not None:
+            self.store.clear()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,172 @@
+from app.database import db
+from flask import request, has_request_context, Response
+from sqlalchemy import event
+from time import perf_counter
+import threading
+import logging
+
+
+logger = logging.getLogger("kanban.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+# Prometheus style histogram with one series per label set
+class Histogram():
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = ",".join(f'{name}="{value}"' for name, value in key)
+                prefix = labels + "," if labels else ""
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series["count"]}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {series['sum']}")
+                lines.append(f"{self.name}_count{suffix} {series['count']}")
+        return lines
+
+
+class Counter():
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def expose(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+# Opt-in per request instrumentation (METRICS_ENABLED): latency, number and
+# duration of SQL statements per endpoint, chart render time and a slow
+# query log, exported at /metrics and optionally in a Server-Timing header.
+# Every worker process keeps its own numbers.
+class Metrics():
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+        self.slow_query_threshold = 0.1
+        self.request_duration = Histogram("kanban_request_duration_seconds", "Request latency by endpoint.", LATENCY_BUCKETS)
+        self.request_queries = Histogram("kanban_request_sql_queries", "SQL statements per request.", QUERY_COUNT_BUCKETS)
+        self.request_sql_duration = Histogram("kanban_request_sql_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+        self.render_duration = Histogram("kanban_chart_render_seconds", "Time spent rendering summary charts.", LATENCY_BUCKETS)
+        self.slow_queries = Counter("kanban_slow_queries_total", "SQL statements slower than the slow query threshold.")
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", False)
+        if not self.enabled:
+            return
+
+        self.server_timing = app.config.get("SERVER_TIMING_HEADER", False)
+        self.slow_query_threshold = app.config.get("SLOW_QUERY_THRESHOLD_MS", 100) / 1000
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+                event.listen(engine, "handle_error", self._handle_error)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+    def _before_request(self):
+        request.environ["kanban.metrics"] = {"start": perf_counter(), "queries": 0, "sql": 0.0, "render": 0.0}
+
+    def _after_request(self, response):
+        stats = request.environ.get("kanban.metrics")
+        if stats is None:
+            return response
+
+        elapsed = perf_counter() - stats["start"]
+        endpoint = request.endpoint or "unknown"
+
+        self.request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+        self.request_queries.observe(stats["queries"], endpoint=endpoint)
+        self.request_sql_duration.observe(stats["sql"], endpoint=endpoint)
+
+        if self.server_timing:
+            timings = [f"app;dur={elapsed * 1000:.1f}",
+                       f'db;dur={stats["sql"] * 1000:.1f};desc="{stats["queries"]} queries"']
+            if stats["render"]:
+                timings.append(f'render;dur={stats["render"] * 1000:.1f}')
+            response.headers["Server-Timing"] = ", ".join(timings)
+
+        return response
+
+    # Start times of the statements running on a connection, with their
+    # cursor. A statement that fails never reaches after_cursor_execute, so
+    # handle_error drops its entry; otherwise later statements would be
+    # timed from its start.
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append((id(cursor), perf_counter()))
+
+    def _handle_error(self, context):
+        if context.connection is None or context.execution_context is None:
+            return
+        starts = context.connection.info.get("query_start")
+        if starts and starts[-1][0] == id(context.execution_context.cursor):
+            starts.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_start"].pop()[1]
+
+        if has_request_context():
+            stats = request.environ.get("kanban.metrics")
+            if stats is not None:
+                stats["queries"] += 1
+                stats["sql"] += elapsed
+
+        if elapsed > self.slow_query_threshold:
+            self.slow_queries.inc()
+            logger.warning("slow query (%.1f ms) on %s: %s", elapsed * 1000,
+                           request.endpoint if has_request_context() else "-", statement)
+
+    # Time spent rendering a chart, in the render pool or inline. Waiting
+    # for a render also counts towards the current request.
+    def observe_render(self, elapsed):
+        if not self.enabled:
+            return
+        self.render_duration.observe(elapsed)
+
+    def observe_render_wait(self, elapsed):
+        if self.enabled and has_request_context():
+            stats = request.environ.get("kanban.metrics")
+            if stats is not None:
+                stats["render"] += elapsed
+
+    def view(self):
+        lines = []
+        for metric in (self.request_duration, self.request_queries, self.request_sql_duration,
+                       self.render_duration, self.slow_queries):
+            lines.extend(metric.expose())
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
@@ -0,0 +1,437 @@
+from app.models import List, Card, archived_cards, changes
+from app.summary import summary_query, rebuild_rollups_statements
+from app.deadlines import deadline_query, digest_query
+from app.ranks import spaced_ranks
+from app.archive import archive_candidates
+from app.changes import changes_to_compact
+from sqlalchemy import select, func
+from itertools import groupby
+from contextlib import contextmanager
+from datetime import datetime, date
+
+
+# A numbered schema change. Steps are SQL strings or callables taking a
+# sqlite3 cursor, and all steps of a migration run in one transaction.
+class Migration():
+    def __init__(self, version, name, steps):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+    def apply(self, cursor):
+        for step in self.steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+
+
+BUMP_LIST_VERSION = """INSERT INTO list_versions (list_id, version) VALUES ({list_id}, 1)
+            ON CONFLICT (list_id) DO UPDATE SET version = version + 1;"""
+
+
+# Rollup changes for one card row (`new` or `old` inside a trigger): added
+# rows are upserted, removed ones decremented and dropped once they reach zero.
+# Removals never create rows, so cards deleted after their list (cascades)
+# cannot bring back the rollups of a deleted list.
+def add_card_rollups(row):
+    return f"""INSERT INTO list_rollups (list_id, total, completed, incomplete)
+            VALUES ({row}.list, 1, {row}.completed = 1, {row}.completed != 1)
+            ON CONFLICT (list_id) DO UPDATE SET total = total + 1,
+                completed = completed + excluded.completed, incomplete = incomplete + excluded.incomplete;
+        INSERT INTO list_completion_days (list_id, day, cards)
+            SELECT {row}.list, date({row}.completed_datetime), 1
+            WHERE {row}.completed = 1 AND date({row}.completed_datetime) IS NOT NULL
+            ON CONFLICT (list_id, day) DO UPDATE SET cards = cards + 1;
+        INSERT INTO list_open_deadlines (list_id, deadline, cards)
+            SELECT {row}.list, {row}.deadline, 1 WHERE {row}.completed != 1
+            ON CONFLICT (list_id, deadline) DO UPDATE SET cards = cards + 1;"""
+
+
+def remove_card_rollups(row):
+    return f"""UPDATE list_rollups SET total = total - 1,
+                completed = completed - ({row}.completed = 1), incomplete = incomplete - ({row}.completed != 1)
+            WHERE list_id = {row}.list;
+        UPDATE list_completion_days SET cards = cards - 1
+            WHERE {row}.completed = 1 AND list_id = {row}.list AND day = date({row}.completed_datetime);
+        DELETE FROM list_completion_days
+            WHERE list_id = {row}.list AND day = date({row}.completed_datetime) AND cards <= 0;
+        UPDATE list_open_deadlines SET cards = cards - 1
+            WHERE {row}.completed != 1 AND list_id = {row}.list AND deadline = {row}.deadline;
+        DELETE FROM list_open_deadlines
+            WHERE list_id = {row}.list AND deadline = {row}.deadline AND cards <= 0;"""
+
+
+# Change log entry for a list or card row (`new` or `old` inside a trigger);
+# `operation` is an SQL expression
+def log_change(entity, row, operation):
+    if entity == "list":
+        user, entity_id, list_id = f"{row}.user", f"{row}.list_id", f"{row}.list_id"
+    else:
+        user, entity_id, list_id = f"(SELECT user FROM lists WHERE list_id = {row}.list)", f"{row}.card_id", f"{row}.list"
+    return f"""INSERT INTO changes (user_id, entity, entity_id, list_id, operation, changed_at)
+            SELECT {user}, '{entity}', {entity_id}, {list_id}, {operation}, datetime('now', 'localtime')
+            WHERE {user} IS NOT NULL;"""
+
+
+# Operation of a card delete: "archive" when the card was just copied to
+# archived_cards by the archive job, "delete" otherwise
+ARCHIVE_OR_DELETE = """CASE WHEN EXISTS (SELECT 1 FROM archived_cards WHERE card_id = old.card_id)
+                THEN 'archive' ELSE 'delete' END"""
+
+
+# rollups of the cards table alone, archived_cards came later
+def _rebuild_rollups(cursor):
+    for statement in rebuild_rollups_statements("cards"):
+        cursor.execute(statement)
+
+
+# Spread out the ranks of the cards of every list in card_id order, the
+# order the board showed so far
+def _backfill_ranks(cursor):
+    rows = cursor.execute("SELECT list, card_id FROM cards ORDER BY list, card_id").fetchall()
+    updates = []
+    for list_id, cards in groupby(rows, key=lambda row: row[0]):
+        card_ids = [card_id for list_id, card_id in cards]
+        updates.extend(zip(spaced_ranks(len(card_ids)), card_ids))
+    cursor.executemany("UPDATE cards SET rank = ? WHERE card_id = ?", updates)
+
+
+MIGRATIONS = [
+    Migration(1, "initial schema", [
+        """CREATE TABLE IF NOT EXISTS "users" (
+            "id" INTEGER NOT NULL,
+            "email" TEXT NOT NULL UNIQUE,
+            "password" TEXT NOT NULL,
+            "name" TEXT NOT NULL,
+            "created_at" TEXT,
+            "updated_at" TEXT,
+            PRIMARY KEY("id")
+        )""",
+        """CREATE TABLE IF NOT EXISTS "lists" (
+            "list_id" INTEGER NOT NULL,
+            "name" TEXT NOT NULL,
+            "user" INTEGER NOT NULL,
+            "created_at" TEXT,
+            "updated_at" TEXT,
+            PRIMARY KEY("list_id" AUTOINCREMENT),
+            FOREIGN KEY("user") REFERENCES "users"("id")
+        )""",
+        """CREATE TABLE IF NOT EXISTS "cards" (
+            "card_id" INTEGER NOT NULL,
+            "title" TEXT NOT NULL,
+            "content" TEXT,
+            "deadline" TEXT NOT NULL,
+            "completed" INTEGER NOT NULL DEFAULT 0,
+            "list" INTEGER NOT NULL,
+            "created_at" TEXT,
+            "updated_at" TEXT,
+            "completed_datetime" TEXT,
+            PRIMARY KEY("card_id" AUTOINCREMENT),
+            FOREIGN KEY("list") REFERENCES "lists"("list_id")
+        )""",
+    ]),
+    Migration(2, "indexes for board, summary and list limit queries", [
+        'CREATE INDEX IF NOT EXISTS ix_lists_user ON lists ("user")',
+        'CREATE INDEX IF NOT EXISTS ix_cards_list_completed_deadline ON cards (list, completed, deadline)',
+    ]),
+    # (list, card_id) order for keyset pagination; card_id is the rowid and
+    # so implicitly the second column of a single column index on list. The
+    # (list, completed, deadline) and (list, rank) indexes only serve the
+    # list = ? part and leave the pages to a sort of the whole list.
+    Migration(3, "index for paginated card listing", [
+        'CREATE INDEX IF NOT EXISTS ix_cards_list ON cards (list)',
+    ]),
+    Migration(4, "per-list version counters", [
+        """CREATE TABLE list_versions (
+            list_id INTEGER NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL
+        )""",
+        "INSERT INTO list_versions (list_id, version) SELECT list_id, 1 FROM lists",
+        f"""CREATE TRIGGER list_versions_list_insert AFTER INSERT ON lists BEGIN
+            {BUMP_LIST_VERSION.format(list_id="new.list_id")}
+        END""",
+        f"""CREATE TRIGGER list_versions_list_update AFTER UPDATE ON lists BEGIN
+            {BUMP_LIST_VERSION.format(list_id="new.list_id")}
+        END""",
+        """CREATE TRIGGER list_versions_list_delete AFTER DELETE ON lists BEGIN
+            DELETE FROM list_versions WHERE list_id = old.list_id;
+        END""",
+        f"""CREATE TRIGGER list_versions_card_insert AFTER INSERT ON cards BEGIN
+            {BUMP_LIST_VERSION.format(list_id="new.list")}
+        END""",
+        f"""CREATE TRIGGER list_versions_card_update AFTER UPDATE ON cards BEGIN
+            {BUMP_LIST_VERSION.format(list_id="new.list")}
+        END""",
+        f"""CREATE TRIGGER list_versions_card_move AFTER UPDATE OF list ON cards WHEN old.list != new.list BEGIN
+            {BUMP_LIST_VERSION.format(list_id="old.list")}
+        END""",
+        f"""CREATE TRIGGER list_versions_card_delete AFTER DELETE ON cards BEGIN
+            {BUMP_LIST_VERSION.format(list_id="old.list")}
+        END""",
+    ]),
+    Migration(5, "summary rollups", [
+        """CREATE TABLE list_rollups (
+            list_id INTEGER NOT NULL PRIMARY KEY,
+            total INTEGER NOT NULL,
+            completed INTEGER NOT NULL,
+            incomplete INTEGER NOT NULL
+        )""",
+        """CREATE TABLE list_completion_days (
+            list_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            cards INTEGER NOT NULL,
+            PRIMARY KEY (list_id, day)
+        )""",
+        """CREATE TABLE list_open_deadlines (
+            list_id INTEGER NOT NULL,
+            deadline DATE NOT NULL,
+            cards INTEGER NOT NULL,
+            PRIMARY KEY (list_id, deadline)
+        )""",
+        _rebuild_rollups,
+        """CREATE TRIGGER rollups_list_insert AFTER INSERT ON lists BEGIN
+            INSERT INTO list_rollups (list_id, total, completed, incomplete) VALUES (new.list_id, 0, 0, 0)
+                ON CONFLICT (list_id) DO NOTHING;
+        END""",
+        """CREATE TRIGGER rollups_list_delete AFTER DELETE ON lists BEGIN
+            DELETE FROM list_rollups WHERE list_id = old.list_id;
+            DELETE FROM list_completion_days WHERE list_id = old.list_id;
+            DELETE FROM list_open_deadlines WHERE list_id = old.list_id;
+        END""",
+        f"""CREATE TRIGGER rollups_card_insert AFTER INSERT ON cards BEGIN
+            {add_card_rollups("new")}
+        END""",
+        f"""CREATE TRIGGER rollups_card_update AFTER UPDATE OF completed, completed_datetime, deadline, list ON cards BEGIN
+            {remove_card_rollups("old")}
+            {add_card_rollups("new")}
+        END""",
+        f"""CREATE TRIGGER rollups_card_delete AFTER DELETE ON cards BEGIN
+            {remove_card_rollups("old")}
+        END""",
+    ]),
+    # external content table: the index only stores the tokens, titles and
+    # contents are read from cards; 'rebuild' indexes the existing cards
+    Migration(6, "full-text search over cards", [
+        """CREATE VIRTUAL TABLE cards_fts USING fts5(
+            title, content,
+            content = 'cards', content_rowid = 'card_id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )""",
+        "INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')",
+        """CREATE TRIGGER cards_fts_insert AFTER INSERT ON cards BEGIN
+            INSERT INTO cards_fts (rowid, title, content) VALUES (new.card_id, new.title, new.content);
+        END""",
+        """CREATE TRIGGER cards_fts_update AFTER UPDATE OF title, content ON cards BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, title, content) VALUES ('delete', old.card_id, old.title, old.content);
+            INSERT INTO cards_fts (rowid, title, content) VALUES (new.card_id, new.title, new.content);
+        END""",
+        """CREATE TRIGGER cards_fts_delete AFTER DELETE ON cards BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, title, content) VALUES ('delete', old.card_id, old.title, old.content);
+        END""",
+    ]),
+    # partial index: only incomplete cards, ordered by deadline per list
+    Migration(7, "deadline index and digests", [
+        'CREATE INDEX IF NOT EXISTS ix_cards_open_deadline ON cards (list, deadline) WHERE completed != 1',
+        """CREATE TABLE deadline_digests (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            overdue INTEGER NOT NULL,
+            due_soon INTEGER NOT NULL,
+            cards TEXT NOT NULL,
+            created_at TEXT,
+            PRIMARY KEY (user_id, day)
+        )""",
+    ]),
+    # (list, rank) serves the ordered cards of a list and its last rank
+    Migration(8, "card positions", [
+        "ALTER TABLE cards ADD COLUMN rank TEXT",
+        _backfill_ranks,
+        'CREATE INDEX IF NOT EXISTS ix_cards_list_rank ON cards (list, rank)',
+    ]),
+    # writes that set row_version themselves (conditional PATCHes) skip the
+    # triggers; every other write of a row gets its version bumped by them
+    Migration(9, "row versions", [
+        "ALTER TABLE lists ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE cards ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1",
+        """CREATE TRIGGER lists_row_version AFTER UPDATE ON lists WHEN new.row_version = old.row_version BEGIN
+            UPDATE lists SET row_version = old.row_version + 1 WHERE list_id = new.list_id;
+        END""",
+        """CREATE TRIGGER cards_row_version AFTER UPDATE ON cards WHEN new.row_version = old.row_version BEGIN
+            UPDATE cards SET row_version = old.row_version + 1 WHERE card_id = new.card_id;
+        END""",
+    ]),
+    # the archive job deletes from cards and inserts into archived_cards, so
+    # the rollups triggers of the two tables cancel out and archived cards
+    # keep counting in the summary; the partial index finds the candidates
+    Migration(10, "card archive", [
+        """CREATE TABLE archived_cards (
+            card_id INTEGER NOT NULL PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT,
+            deadline TEXT NOT NULL,
+            completed INTEGER NOT NULL,
+            list INTEGER NOT NULL,
+            created_at TEXT,
+            updated_at TEXT,
+            completed_datetime TEXT,
+            rank TEXT,
+            archived_at TEXT NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS ix_archived_cards_list ON archived_cards (list)',
+        'CREATE INDEX IF NOT EXISTS ix_cards_completed_at ON cards (completed_datetime) WHERE completed = 1',
+        f"""CREATE TRIGGER rollups_archived_card_insert AFTER INSERT ON archived_cards BEGIN
+            {add_card_rollups("new")}
+        END""",
+        f"""CREATE TRIGGER rollups_archived_card_delete AFTER DELETE ON archived_cards BEGIN
+            {remove_card_rollups("old")}
+        END""",
+        """CREATE TRIGGER archived_cards_list_delete AFTER DELETE ON lists BEGIN
+            DELETE FROM archived_cards WHERE list = old.list_id;
+        END""",
+    ]),
+    # one entry per write of a row: an UPDATE is logged once its row_version
+    # changed, either by the statement itself or by the row version trigger
+    Migration(11, "change log", [
+        """CREATE TABLE changes (
+            change_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            list_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TEXT NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS ix_changes_user_id ON changes (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_changes_changed_at ON changes (changed_at)',
+        """CREATE TABLE changes_horizon (
+            id INTEGER NOT NULL PRIMARY KEY,
+            change_id INTEGER NOT NULL
+        )""",
+        "INSERT INTO changes_horizon (id, change_id) VALUES (1, 0)",
+        f"""CREATE TRIGGER changes_list_insert AFTER INSERT ON lists BEGIN
+            {log_change("list", "new", "'insert'")}
+        END""",
+        f"""CREATE TRIGGER changes_list_update AFTER UPDATE ON lists WHEN new.row_version != old.row_version BEGIN
+            {log_change("list", "new", "'update'")}
+        END""",
+        f"""CREATE TRIGGER changes_list_delete AFTER DELETE ON lists BEGIN
+            {log_change("list", "old", "'delete'")}
+        END""",
+        f"""CREATE TRIGGER changes_card_insert AFTER INSERT ON cards BEGIN
+            {log_change("card", "new", "'insert'")}
+        END""",
+        f"""CREATE TRIGGER changes_card_update AFTER UPDATE ON cards WHEN new.row_version != old.row_version BEGIN
+            {log_change("card", "new", "'update'")}
+        END""",
+        f"""CREATE TRIGGER changes_card_delete AFTER DELETE ON cards BEGIN
+            {log_change("card", "old", "'delete'")}
+        END""",
+    ]),
+    # the archive job inserts a card into archived_cards before deleting it
+    # from cards, so its delete is logged as an "archive"
+    Migration(12, "archive changes", [
+        "DROP TRIGGER changes_card_delete",
+        f"""CREATE TRIGGER changes_card_delete AFTER DELETE ON cards BEGIN
+            {log_change("card", "old", ARCHIVE_OR_DELETE)}
+        END""",
+    ]),
+    Migration(13, "database identity", [
+        """CREATE TABLE database_identity (
+            id INTEGER NOT NULL PRIMARY KEY,
+            token TEXT NOT NULL
+        )""",
+        "INSERT INTO database_identity (id, token) VALUES (1, lower(hex(randomblob(16))))",
+    ]),
+]
+
+
+# Raw sqlite3 connection with transactions managed by hand, the sqlite3
+# module would otherwise commit before every DDL statement
+@contextmanager
+def _raw_cursor(engine):
+    connection = engine.raw_connection()
+    isolation_level = connection.driver_connection.isolation_level
+    connection.driver_connection.isolation_level = None
+    try:
+        yield connection.cursor()
+    finally:
+        connection.driver_connection.isolation_level = isolation_level
+        connection.close()
+
+
+def _ensure_version_table(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+
+
+def current_version(engine):
+    with _raw_cursor(engine) as cursor:
+        _ensure_version_table(cursor)
+        version = cursor.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0]
+        return version or 0
+
+
+# Apply all pending migrations up to `target` (default: the latest) and
+# return the ones that were applied
+def upgrade(engine, target=None):
+    applied = []
+    with _raw_cursor(engine) as cursor:
+        _ensure_version_table(cursor)
+        version = cursor.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0] or 0
+
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            if target is not None and migration.version > target:
+                break
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # re-check inside the write lock, another worker may have
+                # applied this migration in the meantime
+                done = cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (migration.version,)).fetchone()
+                if done is None:
+                    migration.apply(cursor)
+                    cursor.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                                   (migration.version, migration.name, datetime.now().isoformat(" ")))
+                    applied.append(migration)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    return applied
+
+
+# The queries that run on every board load, summary view and list creation
+def hot_queries():
+    return {
+        "board lists": select(List).where(List.user == 1),
+        "board cards": select(Card).where(Card.list.in_([1, 2, 3])).order_by(Card.rank, Card.card_id),
+        "last rank": select(func.max(Card.rank)).where(Card.list == 1),
+        "list limit": select(List.list_id).where(List.user == 1),
+        "summary recount": summary_query(1),
+        "list cards page": select(Card.card_id).where(Card.list == 1, Card.card_id > 100).order_by(Card.card_id).limit(101),
+        "deadlines": deadline_query(1, date(2030, 1, 1), 3),
+        "deadline digest": digest_query(date(2030, 1, 1), 3),
+        "archive candidates": archive_candidates(datetime(2030, 1, 1), 500),
+        "changes page": select(changes.c.change_id).where(changes.c.user_id == 1, changes.c.change_id > 100).order_by(changes.c.change_id).limit(101),
+        "changes to compact": changes_to_compact(datetime(2030, 1, 1), 1000),
+        "archived cards page": select(archived_cards.c.card_id).where(archived_cards.c.list == 1, archived_cards.c.card_id > 100).order_by(archived_cards.c.card_id).limit(101),
+    }
+
+
+# EXPLAIN QUERY PLAN of every hot query, to check that the indexes are used
+def explain(engine):
+    plans = {}
+    with engine.connect() as connection:
+        for name, stmt in hot_queries().items():
+            sql = stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            plans[name] = [row[-1] for row in rows]
+    return plans
@@ -1,4 +1,5 @@
 from app.database import db
+from app.ranks import default_rank
 from flask_login import UserMixin
 from datetime import datetime
 
@@ -10,8 +11,8 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String, nullable=False)
     name = db.Column(db.String, nullable=False)
 
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now())
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now)
+    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now)
 
 
 class List(db.Model):
@@ -19,18 +20,30 @@ class List(db.Model):
     list_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String, nullable=False)
     user = db.Column(db.Integer, db.ForeignKey(
-        'users.id'), nullable=False)
+        'users.id'), nullable=False, index=True)
     cards = db.relationship(
         "Card",
         cascade="all, delete",
+        order_by="(Card.rank, Card.card_id)",
         back_populates="list_ref")
+    # bumped on every write of the row, by the writer or else by a trigger
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_onupdate=db.FetchedValue())
 
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now())
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now)
+    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now)
 
 
 class Card(db.Model):
     __tablename__ = 'cards'
+    __table_args__ = (
+        db.Index('ix_cards_list_completed_deadline', 'list', 'completed', 'deadline'),
+        # (list, card_id) for keyset pages of a list, see migration 3; the
+        # other indexes on list put their columns before the rowid
+        db.Index('ix_cards_list', 'list'),
+        db.Index('ix_cards_open_deadline', 'list', 'deadline', sqlite_where=db.text('completed != 1')),
+        db.Index('ix_cards_list_rank', 'list', 'rank'),
+        db.Index('ix_cards_completed_at', 'completed_datetime', sqlite_where=db.text('completed = 1')),
+    )
     card_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String, nullable=False)
     content = db.Column(db.String)
@@ -39,9 +52,110 @@ class Card(db.Model):
     completed_datetime = db.Column(db.DateTime(timezone=True))
     list = db.Column(db.Integer, db.ForeignKey(
         'lists.list_id', ondelete="CASCADE"), nullable=False)
+    # position within the list, see app/ranks.py; new cards go last
+    rank = db.Column(db.String, default=default_rank)
+    # bumped on every write of the row, by the writer or else by a trigger
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_onupdate=db.FetchedValue())
     list_ref = db.relationship(
         "List",
         back_populates="cards")
         
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now())
\ No newline at end of file
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now)
+    updated_at = db.Column(db.DateTime(timezone=True), onupdate=datetime.now)
+
+
+# Per-list version counter, bumped by triggers on every change to a list or
+# to one of its cards (see app/migrations.py). Used for ETags and caching.
+list_versions = db.Table(
+    'list_versions',
+    db.Column('list_id', db.Integer, primary_key=True),
+    db.Column('version', db.Integer, nullable=False)
+)
+
+
+# Rollups of the cards of every list, kept up to date by triggers on every
+# card write (see app/migrations.py) so the summary never scans cards.
+list_rollups = db.Table(
+    'list_rollups',
+    db.Column('list_id', db.Integer, primary_key=True),
+    db.Column('total', db.Integer, nullable=False),
+    db.Column('completed', db.Integer, nullable=False),
+    db.Column('incomplete', db.Integer, nullable=False)
+)
+
+# Completed cards per list and day of completion
+list_completion_days = db.Table(
+    'list_completion_days',
+    db.Column('list_id', db.Integer, primary_key=True),
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('cards', db.Integer, nullable=False)
+)
+
+# Incomplete cards per list and deadline, for the overdue counts
+list_open_deadlines = db.Table(
+    'list_open_deadlines',
+    db.Column('list_id', db.Integer, primary_key=True),
+    db.Column('deadline', db.Date, primary_key=True),
+    db.Column('cards', db.Integer, nullable=False)
+)
+
+# Completed cards moved out of `cards` by the archive job (app/archive.py):
+# the same columns and card ids, read-only, with the time they were archived.
+# They still count in the rollups, through triggers of their own.
+archived_cards = db.Table(
+    'archived_cards',
+    db.Column('card_id', db.Integer, primary_key=True),
+    db.Column('title', db.String, nullable=False),
+    db.Column('content', db.String),
+    db.Column('deadline', db.Date, nullable=False),
+    db.Column('completed', db.Integer, nullable=False),
+    db.Column('list', db.Integer, nullable=False, index=True),
+    db.Column('created_at', db.DateTime(timezone=True)),
+    db.Column('updated_at', db.DateTime(timezone=True)),
+    db.Column('completed_datetime', db.DateTime(timezone=True)),
+    db.Column('rank', db.String),
+    db.Column('archived_at', db.DateTime(timezone=True), nullable=False)
+)
+
+# Daily digest of the overdue and due soon cards of a user, written by the
+# deadline digest job (app/deadlines.py)
+deadline_digests = db.Table(
+    'deadline_digests',
+    db.Column('user_id', db.Integer, primary_key=True),
+    db.Column('day', db.Date, primary_key=True),
+    db.Column('overdue', db.Integer, nullable=False),
+    db.Column('due_soon', db.Integer, nullable=False),
+    db.Column('cards', db.String, nullable=False),
+    db.Column('created_at', db.DateTime(timezone=True))
+)
+
+# Log of every insert, update and delete of a list or card, written by
+# triggers (see app/migrations.py) and read by the change feed of the API
+# (app/changes.py). change_id is the cursor clients sync from.
+changes = db.Table(
+    'changes',
+    db.Column('change_id', db.Integer, primary_key=True),
+    db.Column('user_id', db.Integer, nullable=False, index=True),
+    db.Column('entity', db.String, nullable=False),
+    db.Column('entity_id', db.Integer, nullable=False),
+    db.Column('list_id', db.Integer, nullable=False),
+    db.Column('operation', db.String, nullable=False),
+    db.Column('changed_at', db.DateTime(timezone=True), nullable=False, index=True)
+)
+
+# Single row: the last change_id removed by the retention job. Cursors
+# before it cannot be synced from anymore.
+changes_horizon = db.Table(
+    'changes_horizon',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('change_id', db.Integer, nullable=False)
+)
+
+# Single row: a random token made when the database was created, which
+# tells this database apart from a recreated or swapped one whose counters
+# (list_versions, row_version) start over
+database_identity = db.Table(
+    'database_identity',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('token', db.String, nullable=False)
+)
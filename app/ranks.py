@@ -0,0 +1,193 @@
+from app.database import db
+from sqlalchemy import select, update, or_, and_, text
+import threading
+
+
+# Cards are ordered within their list by `rank`, a string compared byte by
+# byte (SQLite's BINARY collation, Python's str order). There is always a key
+# between two different keys, so a card is moved by rewriting its own rank
+# only, never the ranks of its neighbours. Keys are base 62 digits and never
+# end in "0", which keeps room below every key.
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+INDEX = {digit: index for index, digit in enumerate(DIGITS)}
+
+
+# Key strictly between a and b, where a may be "" (no lower bound) and b
+# None (no upper bound)
+def midpoint(a, b):
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + midpoint(a[n:], b[n:])
+
+    low = INDEX[a[0]] if a else 0
+    high = INDEX[b[0]] if b is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[low] + midpoint(a[1:], None)
+
+
+# Short key after `a`: appending cards one by one grows keys by one digit
+# every 61 cards instead of halving the remaining space every time
+def rank_after(a):
+    if not a:
+        return midpoint("", None)
+    for i, digit in enumerate(a):
+        if digit != DIGITS[-1]:
+            return a[:i] + DIGITS[INDEX[digit] + 1]
+    return a + DIGITS[1]
+
+
+def rank_before(b):
+    if b is None:
+        return midpoint("", None)
+    for i, digit in enumerate(b):
+        if INDEX[digit] > 1:
+            return b[:i] + DIGITS[INDEX[digit] - 1]
+    return midpoint("", b)
+
+
+# Key between the ranks of two neighbours, either of which may be None (the
+# start or the end of the list). None when there is no room, i.e. the two
+# neighbours share a rank; the list needs a rebalance first.
+def rank_between(a, b):
+    if a is None:
+        return rank_before(b)
+    if b is None:
+        return rank_after(a)
+    if a >= b:
+        return None
+    return midpoint(a, b)
+
+
+# `count` evenly spaced keys of the same (shortest) length, for a rebalance
+def spaced_ranks(count):
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+
+    ranks = []
+    for position in range(1, count + 1):
+        value = position * BASE ** width // (count + 1)
+        digits = ""
+        for i in range(width):
+            value, digit = divmod(value, BASE)
+            digits = DIGITS[digit] + digits
+        ranks.append(digits.rstrip("0"))
+    return ranks
+
+
+# Column default of Card.rank: new cards go to the end of their list
+LAST_RANK = text("SELECT max(rank) FROM cards WHERE list = :list")
+
+
+def default_rank(context):
+    list_id = context.get_current_parameters().get("list")
+    return rank_after(context.connection.execute(LAST_RANK, {"list": list_id}).scalar())
+
+
+def last_rank(list_id):
+    return db.session.execute(LAST_RANK, {"list": list_id}).scalar()
+
+
+# Ranks of cards inserted together with one executemany statement, where
+# the column default would give all new cards of a list the same rank: every
+# card goes after the previous one of its list
+def assign_ranks(cards):
+    last = {}
+    for card in cards:
+        list_id = card["list"]
+        if list_id not in last:
+            last[list_id] = last_rank(list_id)
+        card["rank"] = last[list_id] = rank_after(last[list_id])
+
+
+# Ranks of the cards right before and after a position in a list, ignoring
+# the card being moved: after the card `after`, before the card `before`, or
+# at the end. Returns (lower, upper).
+def neighbours(list_id, card_id, after=None, before=None):
+    from app.models import Card # app.models imports this module
+
+    stmt = select(Card.rank).where(Card.list == list_id, Card.card_id != card_id)
+
+    if after is not None:
+        lower = after.rank
+        upper = db.session.scalar(
+            stmt.where(or_(Card.rank > after.rank, and_(Card.rank == after.rank, Card.card_id > after.card_id)))
+            .order_by(Card.rank, Card.card_id).limit(1))
+        return lower, upper
+
+    if before is not None:
+        upper = before.rank
+        lower = db.session.scalar(
+            stmt.where(or_(Card.rank < before.rank, and_(Card.rank == before.rank, Card.card_id < before.card_id)))
+            .order_by(Card.rank.desc(), Card.card_id.desc()).limit(1))
+        return lower, upper
+
+    return db.session.scalar(stmt.order_by(Card.rank.desc()).limit(1)), None
+
+
+# Rewrite the ranks of a list as evenly spaced short keys, in the current
+# order. Runs in the caller's transaction. Returns the number of cards.
+def rebalance(list_id):
+    from app.models import Card
+
+    card_ids = db.session.scalars(
+        select(Card.card_id).where(Card.list == list_id).order_by(Card.rank, Card.card_id)).all()
+    ranks = spaced_ranks(len(card_ids))
+    if card_ids:
+        db.session.execute(update(Card), [{"card_id": card_id, "rank": rank} for card_id, rank in zip(card_ids, ranks)])
+    return len(card_ids)
+
+
+# Lists whose longest rank has more than `max_length` characters, or where
+# two cards share a rank
+def lists_to_rebalance(max_length):
+    return db.session.scalars(text("""
+        SELECT list FROM cards GROUP BY list
+        HAVING max(length(rank)) > :max_length OR count(DISTINCT rank) < count(*)
+        ORDER BY list
+    """), {"max_length": max_length}).all()
+
+
+# Rebalances of the lists whose keys got too long after a move, in a
+# background thread so the request that noticed it does not wait. A list is
+# queued at most once at a time.
+class Rebalancer():
+    def __init__(self):
+        self.app = None
+        self.max_length = 32
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_length = app.config.get("RANK_MAX_LENGTH", self.max_length)
+
+    def needed(self, rank):
+        return rank is not None and len(rank) > self.max_length
+
+    def schedule(self, list_id):
+        with self._lock:
+            if list_id in self._pending:
+                return
+            self._pending.add(list_id)
+        threading.Thread(target=self._run, args=(list_id,), name=f"rebalance-{list_id}", daemon=True).start()
+
+    def _run(self, list_id):
+        from app.writes import write_coalescer
+
+        try:
+            with self.app.app_context():
+                write_coalescer.run(lambda: rebalance(list_id))
+        finally:
+            with self._lock:
+                self._pending.discard(list_id)
+
+
+rebalancer = Rebalancer()
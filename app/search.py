@@ -0,0 +1,60 @@
+from app.database import db
+from sqlalchemy import text
+import re
+
+
+# Card titles and contents are indexed in the cards_fts FTS5 table, an
+# external content table over cards kept in sync by triggers (see
+# app/migrations.py). Titles weigh more than contents in the ranking.
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+SNIPPET_START = "["
+SNIPPET_END = "]"
+SNIPPET_TOKENS = 12
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+
+# Turn free text into an FTS5 query: every word must match, as a prefix, so
+# "dead lin" finds "deadline". Operators and quotes in the input are never
+# interpreted. Returns None when there is nothing to search for.
+def fts_query(q):
+    terms = TERM.findall(q or "")
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+SEARCH_SQL = text(f"""
+    SELECT cards.card_id, cards.title, cards.list, cards.deadline, cards.completed,
+           snippet(cards_fts, -1, :start, :end, '...', :tokens) AS snippet,
+           bm25(cards_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS score
+    FROM cards_fts
+    JOIN cards ON cards.card_id = cards_fts.rowid
+    JOIN lists ON lists.list_id = cards.list
+    WHERE cards_fts MATCH :query AND lists.user = :user_id
+    ORDER BY score, cards.card_id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+# Best matches first among the cards of the user's lists, one page at a time
+def search_cards(user_id, query, limit=20, offset=0):
+    return db.session.execute(SEARCH_SQL, {
+        "query": query, "user_id": user_id, "limit": limit, "offset": offset,
+        "start": SNIPPET_START, "end": SNIPPET_END, "tokens": SNIPPET_TOKENS,
+    }).all()
+
+
+# Rebuild the whole index from the cards table, e.g. after loading cards
+# with triggers disabled, then merge its segments
+def rebuild_index():
+    db.session.execute(text("INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')"))
+    db.session.execute(text("INSERT INTO cards_fts (cards_fts) VALUES ('optimize')"))
+    db.session.commit()
+
+
+# FTS5 integrity check against the cards table; raises when they disagree
+def check_index():
+    db.session.execute(text("INSERT INTO cards_fts (cards_fts, rank) VALUES ('integrity-check', 1)"))
@@ -0,0 +1,171 @@
+from flask import current_app, make_response
+from flask_restful import fields
+import json
+import threading
+
+
+# Field specs of app/api.py compiled once into encoders that produce exactly
+# what flask_restful's marshal would: same keys in the same order, same
+# values, so the JSON on the wire does not change. marshal looks up every
+# field class and formats values through several method calls per field
+# and per object; an encoder is a flat list of (key, formatter) pairs.
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+# Same string as fields.DateTime's rfc822 format, i.e.
+# email.utils.formatdate(calendar.timegm(value.utctimetuple()))
+def rfc822(value):
+    t = value.utctimetuple()
+    return "%s, %02d %s %04d %02d:%02d:%02d -0000" % (
+        DAYS[t.tm_wday], t.tm_mday, MONTHS[t.tm_mon - 1], t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def iso8601(value):
+    return value.isoformat()
+
+
+# Formatter of a field: turns the raw value of the field into its output,
+# None included. Returns None for field types without a compiled formatter,
+# which keep their own (slower) implementation.
+def compile_field(field):
+    default = field.default
+    kind = type(field)
+
+    if kind is fields.Integer:
+        return lambda value: default if value is None else int(value)
+
+    if kind is fields.String:
+        return lambda value: default if value is None else str(value)
+
+    if kind is fields.Float:
+        return lambda value: default if value is None else float(value)
+
+    if kind is fields.DateTime and field.dt_format in ("rfc822", "iso8601"):
+        format = rfc822 if field.dt_format == "rfc822" else iso8601
+        return lambda value: default if value is None else format(value)
+
+    if kind is fields.Raw:
+        return lambda value: default if value is None else value
+
+    if kind is fields.Nested:
+        nested = Serializer(field.nested)
+        allow_null = field.allow_null
+
+        def format_nested(value):
+            if value is None:
+                if allow_null:
+                    return None
+                if default is not None:
+                    return default
+            return nested(value)
+
+        return format_nested
+
+    if kind is fields.List and isinstance(field.container, fields.Nested):
+        item = compile_field(field.container)
+
+        def format_list(value):
+            if value is None:
+                return default
+            if isinstance(value, dict) or hasattr(value, "strip") or not hasattr(value, "__iter__"):
+                return [item(value)]
+            return [item(entry) for entry in value]
+
+        return format_list
+
+    return None
+
+
+class Serializer():
+    def __init__(self, spec):
+        self.spec = spec
+        self._fields = []
+        for name, field in spec.items():
+            if isinstance(field, type):
+                field = field()
+            if isinstance(field, dict): # a dict formats the whole object
+                self._fields.append((name, None, None, Serializer(field)))
+                continue
+            key = field.attribute or name
+            self._fields.append((name, key, compile_field(field), field))
+        self._selections = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, obj):
+        output = {}
+        is_dict = isinstance(obj, dict)
+        for name, key, format, field in self._fields:
+            if format is not None:
+                output[name] = format(obj.get(key) if is_dict else getattr(obj, key, None))
+            elif key is None:
+                output[name] = field(obj)
+            else:
+                output[name] = field.output(key, obj)
+        return output
+
+    # Serializer for a subset of the fields, in the order of the spec. Built
+    # once per distinct selection; unknown names raise a KeyError.
+    def select(self, names):
+        names = tuple(names)
+        selection = self._selections.get(names)
+        if selection is None:
+            unknown = [name for name in names if name not in self.spec]
+            if unknown:
+                raise KeyError(unknown[0])
+            selection = Serializer({name: field for name, field in self.spec.items() if name in names})
+            with self._lock:
+                selection = self._selections.setdefault(names, selection)
+        return selection
+
+
+# Names of a ?fields= value, e.g. "card_id,title,deadline", or None when
+# every field is wanted
+def parse_fields(value):
+    if value is None:
+        return None
+    names = tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+    return names or None
+
+
+# JSON encoding. The standard library gives the bytes flask_restful has
+# always sent; JSON_BACKEND = "orjson" switches to orjson when it is
+# installed, which is several times faster but writes compact JSON with
+# unescaped non-ASCII characters, so it is opt-in.
+_orjson = None
+
+
+def orjson_module():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+        except ImportError:
+            orjson = False
+        _orjson = orjson
+    return _orjson or None
+
+
+def dumps(data, **settings):
+    if not settings and current_app.config.get("JSON_BACKEND") == "orjson":
+        orjson = orjson_module()
+        if orjson is not None:
+            return orjson.dumps(data).decode()
+    return json.dumps(data, **settings)
+
+
+# Settings of flask_restful's JSON representation: RESTFUL_JSON, indented
+# in debug mode
+def json_settings():
+    settings = dict(current_app.config.get("RESTFUL_JSON", {}))
+    if current_app.debug:
+        settings.setdefault("indent", 4)
+    return settings
+
+
+# Drop-in for flask_restful's output_json
+def output_json(data, code, headers=None):
+    response = make_response(dumps(data, **json_settings()) + "\n", code)
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,169 @@
+from app.database import db
+from app.models import List, Card, archived_cards, list_rollups, list_completion_days, list_open_deadlines
+from sqlalchemy import select, func, case, and_, text, union_all
+from datetime import datetime
+
+
+# Every card the rollups count: the active ones and the archived ones
+ALL_CARDS = """(SELECT card_id, list, completed, completed_datetime, deadline FROM cards
+        UNION ALL SELECT card_id, list, completed, completed_datetime, deadline FROM archived_cards)"""
+
+
+# Recompute the rollup tables from `cards`, a table or subquery. Also the
+# backfill of the migration that introduced them, so plain SQL without bound
+# parameters.
+def rebuild_rollups_statements(cards):
+    return [
+        "DELETE FROM list_rollups",
+        "DELETE FROM list_completion_days",
+        "DELETE FROM list_open_deadlines",
+        f"""INSERT INTO list_rollups (list_id, total, completed, incomplete)
+            SELECT lists.list_id, COUNT(cards.card_id),
+                   COALESCE(SUM(cards.completed = 1), 0), COALESCE(SUM(cards.completed != 1), 0)
+            FROM lists LEFT OUTER JOIN {cards} AS cards ON cards.list = lists.list_id
+            GROUP BY lists.list_id""",
+        f"""INSERT INTO list_completion_days (list_id, day, cards)
+            SELECT cards.list, date(cards.completed_datetime), COUNT(*)
+            FROM {cards} AS cards JOIN lists ON lists.list_id = cards.list
+            WHERE cards.completed = 1 AND date(cards.completed_datetime) IS NOT NULL
+            GROUP BY cards.list, date(cards.completed_datetime)""",
+        f"""INSERT INTO list_open_deadlines (list_id, deadline, cards)
+            SELECT cards.list, cards.deadline, COUNT(*)
+            FROM {cards} AS cards JOIN lists ON lists.list_id = cards.list
+            WHERE cards.completed != 1
+            GROUP BY cards.list, cards.deadline""",
+    ]
+
+
+REBUILD_ROLLUPS = rebuild_rollups_statements(ALL_CARDS)
+
+
+# Grouped query over the raw cards, archived ones included. Every (list,
+# completed, completion date) combination becomes one row, so no Card objects
+# are ever loaded no matter how many cards a list holds. Without a user it
+# covers every list.
+def summary_query(user_id, list_id=None, today=None):
+    if today is None:
+        today = datetime.today().date()
+
+    # both branches of the union are filtered by list, so each is read from
+    # its index on list instead of being materialized for every card
+    def card_rows(table):
+        stmt = select(*[table.c[name] for name in ("card_id", "list", "completed", "completed_datetime", "deadline")])
+        if user_id is not None:
+            stmt = stmt.where(table.c.list.in_(select(List.list_id).where(List.user == user_id)))
+        if list_id is not None:
+            stmt = stmt.where(table.c.list == list_id)
+        return stmt
+
+    cards = union_all(card_rows(Card.__table__), card_rows(archived_cards)).subquery("all_cards")
+
+    is_completed = case((cards.c.completed == 1, 1), else_=0)
+    completed_day = func.date(cards.c.completed_datetime, type_=db.Date)
+    overdue = case((and_(cards.c.completed != 1, cards.c.deadline < today), 1), else_=0)
+
+    stmt = (
+        select(
+            List.list_id,
+            is_completed.label("is_completed"),
+            completed_day.label("completed_day"),
+            func.count(cards.c.card_id).label("cards"),
+            func.coalesce(func.sum(overdue), 0).label("overdue"),
+        )
+        .select_from(List)
+        .outerjoin(cards, cards.c.list == List.list_id)
+        .group_by(List.list_id, is_completed, completed_day)
+        .order_by(List.list_id, completed_day)
+    )
+
+    if user_id is not None:
+        stmt = stmt.where(List.user == user_id)
+
+    if list_id is not None:
+        stmt = stmt.where(List.list_id == list_id)
+
+    return stmt
+
+
+def _empty_counts():
+    return {"total": 0, "total_completed": 0, "total_incomplete": 0, "d_passed": 0, "histogram": {}}
+
+
+# Summary statistics computed from the raw cards, the reference the rollups
+# are verified against
+def count_cards(user_id=None, list_id=None, today=None):
+    counts = {}
+    for row in db.session.execute(summary_query(user_id, list_id, today)):
+        count = counts.setdefault(row.list_id, _empty_counts())
+        count["total"] += row.cards
+
+        if row.is_completed:
+            count["total_completed"] += row.cards # calculate how many tasks are completed
+            if row.completed_day is not None:
+                count["histogram"][row.completed_day] = row.cards
+        else:
+            count["total_incomplete"] += row.cards # calculate how many tasks are incomplete
+            count["d_passed"] += row.overdue # Out of the total incomplete tasks, calculate how many have passed the deadline
+
+    return counts
+
+
+# Statistics shown on the summary page, read from the rollup tables: one row
+# per list, one per day with completions and one per pending deadline, no
+# matter how many cards the lists hold
+def summary_counts(user_id, list_id=None, today=None):
+    if today is None:
+        today = datetime.today().date()
+
+    def for_lists(stmt, column):
+        stmt = stmt.join(List, List.list_id == column)
+        if user_id is not None:
+            stmt = stmt.where(List.user == user_id)
+        if list_id is not None:
+            stmt = stmt.where(List.list_id == list_id)
+        return stmt
+
+    counts = {}
+
+    totals = select(List.list_id, list_rollups.c.total, list_rollups.c.completed, list_rollups.c.incomplete) \
+        .select_from(list_rollups)
+    for row in db.session.execute(for_lists(totals, list_rollups.c.list_id).order_by(List.list_id)):
+        count = counts[row.list_id] = _empty_counts()
+        count["total"] = row.total
+        count["total_completed"] = row.completed
+        count["total_incomplete"] = row.incomplete
+
+    days = select(list_completion_days.c.list_id, list_completion_days.c.day, list_completion_days.c.cards)
+    days = for_lists(days, list_completion_days.c.list_id).order_by(list_completion_days.c.list_id, list_completion_days.c.day)
+    for row in db.session.execute(days):
+        counts.setdefault(row.list_id, _empty_counts())["histogram"][row.day] = row.cards
+
+    overdue = select(list_open_deadlines.c.list_id, func.sum(list_open_deadlines.c.cards).label("cards")) \
+        .where(list_open_deadlines.c.deadline < today) \
+        .group_by(list_open_deadlines.c.list_id)
+    for row in db.session.execute(for_lists(overdue, list_open_deadlines.c.list_id)):
+        counts.setdefault(row.list_id, _empty_counts())["d_passed"] = row.cards
+
+    return counts
+
+
+def rebuild_rollups():
+    for statement in REBUILD_ROLLUPS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+# Compare the rollups of every list with a recount from the cards and return
+# the differences as (list_id, field, expected, actual)
+def verify_rollups(today=None):
+    expected = count_cards(today=today)
+    actual = summary_counts(None, today=today)
+
+    drift = []
+    for list_id in sorted(set(expected) | set(actual)):
+        want = expected.get(list_id, _empty_counts())
+        have = actual.get(list_id, _empty_counts())
+        for field in ("total", "total_completed", "total_incomplete", "d_passed", "histogram"):
+            if want[field] != have[field]:
+                drift.append((list_id, field, want[field], have[field]))
+    return drift
@@ -0,0 +1,186 @@
+from app.database import db
+from app.models import List, Card
+from app.ranks import assign_ranks
+from app.writes import write_coalescer
+from app.validation import CardValidationError, ListValidationError, TransferValidationError
+from sqlalchemy import select, insert, func
+from datetime import datetime
+import json
+import csv
+import io
+
+
+# One flat record per card, with the list it belongs to; lists without
+# cards are exported as a record with empty card fields
+EXPORT_FIELDS = ["list_id", "list_name", "card_id", "title", "content", "deadline", "completed", "completed_datetime"]
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_query(user_id):
+    return (
+        select(List.list_id, List.name.label("list_name"), Card.card_id, Card.title, Card.content,
+               Card.deadline, Card.completed, Card.completed_datetime)
+        .select_from(List)
+        .outerjoin(Card, Card.list == List.list_id)
+        .where(List.user == user_id)
+        .order_by(List.list_id, Card.rank, Card.card_id)
+    )
+
+
+# Records of a user's board, read from a server side cursor
+def export_records(user_id, batch_size=1000):
+    result = db.session.execute(export_query(user_id).execution_options(yield_per=batch_size))
+    for row in result:
+        record = row._asdict()
+        for field in ("deadline", "completed_datetime"):
+            if record[field] is not None:
+                record[field] = record[field].isoformat()
+        yield record
+
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+def to_csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+ENCODERS = {
+    "csv": to_csv,
+    "ndjson": to_ndjson,
+}
+
+
+# (line number, record) pairs of an uploaded file, read line by line from a
+# binary stream. Malformed records come back as TransferValidationErrors.
+def read_ndjson(stream):
+    for line, text in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            record = TransferValidationError(status_code = 400, error_code = "T102", error_message = "record is not a JSON object")
+        yield line, record
+
+
+def read_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    for record in reader:
+        # empty CSV cells are missing values
+        yield reader.line_num, {key: value if value != "" else None for key, value in record.items()}
+
+
+DECODERS = {
+    "csv": read_csv,
+    "ndjson": read_ndjson,
+}
+
+
+def parse_completed_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Import exported records as new lists and cards of a user. Every source
+# list becomes a new list, within the limit of five lists per user, and
+# every card is checked like CardAPI does; invalid records are reported and
+# skipped. A list is only created with its first valid record, so a list
+# whose cards all fail is neither created nor counted against the limit.
+# Every `chunk_size` cards, the chunk's new lists and its cards (inserted
+# with executemany statements) are written as one write_coalescer write.
+def import_records(user_id, records, chunk_size=1000, max_errors=100):
+    from app.api import validate_card_fields # app.api imports this module
+
+    result = {"lists": 0, "cards": 0, "failed": 0, "errors": []}
+    lists = db.session.scalar(select(func.count(List.list_id)).where(List.user == user_id))
+    db.session.close() # no read transaction held while the chunks are written
+    list_ids = {} # source list id (or name) -> new list id, None once refused
+    new_lists = {} # source -> name of the lists created with the next chunk
+    cards = [] # (source, card) pairs of the next chunk
+
+    # Create the lists of a chunk and insert its cards, returns the ids of
+    # the new lists
+    def write_chunk(chunk_lists, chunk_cards):
+        created = {}
+        for source, name in chunk_lists.items():
+            new_list = List(name=name, user=user_id)
+            db.session.add(new_list)
+            db.session.flush()
+            created[source] = new_list.list_id
+
+        rows = [dict(card, list=created[source] if source in created else list_ids[source])
+                for source, card in chunk_cards]
+        if rows:
+            assign_ranks(rows)
+            db.session.execute(insert(Card.__table__), rows)
+        return created
+
+    def write():
+        nonlocal new_lists, cards
+        if new_lists or cards:
+            chunk_lists, chunk_cards = new_lists, cards
+            list_ids.update(write_coalescer.run(lambda: write_chunk(chunk_lists, chunk_cards)))
+            result["cards"] += len(chunk_cards)
+        new_lists, cards = {}, []
+
+    for line, record in records:
+        try:
+            if isinstance(record, TransferValidationError):
+                raise record
+
+            source = record.get("list_id") or record.get("list_name")
+            known = source in list_ids or source in new_lists
+            if not known and not record.get("list_name"):
+                raise ListValidationError(status_code = 400, error_code = "L101", error_message = "name is required")
+
+            card = None
+            if any(record.get(field) is not None for field in ("card_id", "title", "content", "deadline")):
+                card = validate_card_fields(record) # a record without them is a list without cards
+
+            if not known:
+                if lists > 4:
+                    list_ids[source] = None
+                else:
+                    new_lists[source] = record["list_name"]
+                    lists += 1
+                    result["lists"] += 1
+
+            if source in list_ids and list_ids[source] is None:
+                raise ListValidationError(status_code = 400, error_code = "L103", error_message = "Cannot create more than 5 lists for a user")
+
+            if card is None:
+                continue
+
+            if card["completed"] == "1":
+                card["completed_datetime"] = parse_completed_datetime(record.get("completed_datetime")) or card["completed_datetime"]
+            cards.append((source, card))
+        except (TransferValidationError, ListValidationError, CardValidationError) as e:
+            result["failed"] += 1
+            if len(result["errors"]) < max_errors:
+                result["errors"].append({"line": line, "error_code": e.error_code, "error_message": e.error_message})
+            continue
+
+        if len(cards) >= chunk_size:
+            write()
+
+    write()
+    return result
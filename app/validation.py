@@ -2,26 +2,38 @@ from werkzeug.exceptions import HTTPException
 from flask import make_response
 import json
 
-class UserValidationError(HTTPException):
-    def __init__(self, error_code, error_message):
-        message = {
-            "error_code": error_code,
-            "error_message": error_message
-        }
-        self.response = make_response(json.dumps(message), 404)
 
-class ListValidationError(HTTPException):
+# Error with a JSON body of an error code and message, e.g. {"error_code":
+# "L104", "error_message": "List does not exist"}
+class ValidationError(HTTPException):
     def __init__(self, status_code, error_code, error_message):
+        self.status_code = status_code
+        self.error_code = error_code
+        self.error_message = error_message
         message = {
             "error_code": error_code,
             "error_message": error_message
         }
         self.response = make_response(json.dumps(message), status_code)
 
-class CardValidationError(HTTPException):
-    def __init__(self, status_code, error_code, error_message):
-        message = {
-            "error_code": error_code,
-            "error_message": error_message
-        }
-        self.response = make_response(json.dumps(message), status_code)
+class UserValidationError(ValidationError):
+    def __init__(self, error_code, error_message, status_code = 404):
+        super().__init__(status_code, error_code, error_message)
+
+class ListValidationError(ValidationError):
+    pass
+
+class CardValidationError(ValidationError):
+    pass
+
+
+class SearchValidationError(ValidationError):
+    pass
+
+
+class TransferValidationError(ValidationError):
+    pass
+
+
+class ChangesValidationError(ValidationError):
+    pass
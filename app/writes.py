@@ -0,0 +1,127 @@
+from app.database import db
+from concurrent.futures import Future, TimeoutError
+from werkzeug.exceptions import ServiceUnavailable
+from time import monotonic
+import threading
+import queue
+import os
+
+
+# The writer thread did not commit a write within GROUP_COMMIT_TIMEOUT. The
+# write stays queued and may still be committed, so a client must check
+# before it retries, or it can create the same card or list twice.
+class WriteTimeout(ServiceUnavailable):
+    description = ("The write was not committed in time. It is still queued and may yet be applied, "
+                   "check whether it was before retrying.")
+
+
+# Group commit of small writes. Every card and list mutation of the pages and
+# the API is a function that works on db.session without committing, passed
+# to write_coalescer.run(). By default it runs in the request and is
+# committed on its own, as before.
+#
+# With GROUP_COMMIT enabled, mutations are queued instead, and one writer
+# thread per process runs everything that arrives within
+# GROUP_COMMIT_WINDOW_MS (at most GROUP_COMMIT_MAX_BATCH mutations) in a
+# single transaction: one write lock and one fsync for the whole group.
+# Every mutation runs in its own SAVEPOINT, so one that fails is rolled back
+# alone and its request gets its own error; the others are committed. Each
+# request waits until the group is committed and gets the result of its
+# function, or the exception it raised.
+class WriteCoalescer():
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.window = 0.002
+        self.max_batch = 100
+        self.timeout = 10
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get("GROUP_COMMIT", False)
+        self.window = app.config.get("GROUP_COMMIT_WINDOW_MS", 2) / 1000
+        self.max_batch = app.config.get("GROUP_COMMIT_MAX_BATCH", 100)
+        self.timeout = app.config.get("GROUP_COMMIT_TIMEOUT", 10)
+
+    def run(self, write):
+        if not self.enabled:
+            result = write()
+            db.session.commit()
+            return result
+
+        future = Future()
+        self._start()
+        self._queue.put((write, future))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise WriteTimeout(retry_after=1)
+
+    # The writer thread is started on first use, and again in a forked
+    # worker, where the thread of the parent does not exist
+    def _start(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name="write-coalescer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        with self.app.app_context():
+            while True:
+                batch = [self._queue.get()]
+                deadline = monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self.commit(batch)
+
+    # Run a group of (write, future) pairs in one transaction and resolve
+    # the futures once it is committed
+    def commit(self, batch):
+        outcomes = []
+        try:
+            if db.engine.dialect.name == "sqlite":
+                # take the write lock up front; pysqlite would otherwise
+                # let the first SAVEPOINT start (and its RELEASE end) the
+                # transaction
+                db.session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+            for write, future in batch:
+                try:
+                    with db.session.begin_nested():
+                        result = write()
+                except Exception as e:
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            outcomes = [(future, None, error or e) for future, result, error in outcomes]
+            done = {id(future) for future, result, error in outcomes}
+            outcomes += [(future, None, e) for write, future in batch if id(future) not in done]
+        finally:
+            db.session.remove()
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+write_coalescer = WriteCoalescer()
@@ -0,0 +1,6 @@
+from app import create_app
+from app.asgi import create_asgi_app
+
+# ASGI entry point: async list and card API with the Flask app mounted
+# behind it, e.g. `uvicorn asgi:app --workers 4`
+app = create_asgi_app(create_app())
@@ -0,0 +1,145 @@
+from bench.harness import summarize
+from time import perf_counter
+import argparse
+import asyncio
+import random
+import json
+
+
+# Minimal in-process ASGI client, so both paths are driven the same way
+async def call(app, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    headers = [(b"content-type", b"application/json")] if body is not None else []
+    headers.append((b"content-length", str(len(data)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method.upper(),
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": headers + [(b"host", b"bench.local")], "client": ("127.0.0.1", 0), "server": ("bench.local", 80),
+    }
+    sent = False
+    status = []
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600) # only a disconnect would come next
+        sent = True
+        return {"type": "http.request", "body": data, "more_body": False}
+
+    chunks = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status[0], b"".join(chunks)
+
+
+class AsyncHarness():
+    def __init__(self, app, prefix):
+        self.app = app
+        self.prefix = prefix
+        self.samples = {}
+        self.errors = {}
+
+    async def request(self, name, method, path, expected, body=None):
+        name = f"{self.prefix} {name}"
+        start = perf_counter()
+        status, data = await call(self.app, method, path, body)
+        self.samples.setdefault(name, []).append(perf_counter() - start)
+        if status != expected:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return data
+
+    async def scenario(self, list_id, card_id):
+        await self.request("GET /api/list", "get", f"/api/list/{list_id}", 200)
+        await self.request("GET /api/card", "get", f"/api/card/{card_id}", 200)
+
+        data = await self.request("POST /api/card", "post", "/api/card", 201, {
+            "title": "Bench card", "content": "Created by the benchmark", "deadline": "2030-01-01",
+            "completed": "0", "list": list_id
+        })
+        new_card = json.loads(data)["card_id"]
+        await self.request("PUT /api/card", "put", f"/api/card/{new_card}", 200, {
+            "title": "Bench card", "content": "Updated by the benchmark", "deadline": "2030-01-02",
+            "completed": "1"
+        })
+        await self.request("DELETE /api/card", "delete", f"/api/card/{new_card}", 200)
+
+    # Run `requests` scenarios, `concurrency` at a time, and return the
+    # latency summaries plus the requests per second over the wall time
+    async def run(self, requests, concurrency, list_ids, card_ids, rng):
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait((rng.choice(list_ids), rng.choice(card_ids)))
+
+        async def worker():
+            while not queue.empty():
+                await self.scenario(*queue.get_nowait())
+
+        start = perf_counter()
+        await asyncio.gather(*(worker() for i in range(concurrency)))
+        elapsed = perf_counter() - start
+
+        results = {name: summarize(durations, self.errors.get(name, 0)) for name, durations in self.samples.items()}
+        total = sum(len(durations) for durations in self.samples.values())
+        results[f"{self.prefix} all"] = dict(summarize(sum(self.samples.values(), []), sum(self.errors.values())),
+                                             throughput_rps=total / elapsed)
+        return results
+
+
+# Same API scenario against the flask_restful resources (through the WSGI
+# adapter, as they would be served next to the async API) and against the
+# async resources, `concurrency` clients at a time
+def run(flask_app, requests, concurrency=16, warmup=5, seed=0):
+    from app.asgi import create_asgi_app, wsgi_app
+    from app.database import db
+    from app.models import List, Card
+    from sqlalchemy import select
+
+    with flask_app.app_context():
+        list_ids = db.session.scalars(select(List.list_id)).all()
+        card_ids = db.session.scalars(select(Card.card_id)).all()
+
+    apps = {
+        "sync": wsgi_app(flask_app),
+        "async": create_asgi_app(flask_app),
+    }
+
+    # one event loop per path, the async engine's connections belong to it
+    async def measure(app, prefix):
+        rng = random.Random(seed)
+        await AsyncHarness(app, prefix).run(warmup, concurrency, list_ids, card_ids, rng)
+        return await AsyncHarness(app, prefix).run(requests, concurrency, list_ids, card_ids, rng)
+
+    results = {}
+    for prefix, app in apps.items():
+        results.update(asyncio.run(measure(app, prefix)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync and async API in-process against a seeded database. "
+                                                 "Configure the app through KANBAN_ENV/DATABASE_URL before running.")
+    parser.add_argument("--requests", type=int, default=100, help="scenario iterations per path")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="JSON file for the results")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    results = run(app, args.requests, args.concurrency, args.warmup, args.seed)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from time import perf_counter
+import argparse
+import random
+import json
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    k = (len(samples) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (k - lower)
+
+
+# Latency percentiles (milliseconds) and throughput of a list of durations
+def summarize(durations, errors=0):
+    total = sum(durations)
+    summary = {
+        "count": len(durations),
+        "errors": errors,
+        "mean_ms": total / len(durations) * 1000 if durations else None,
+        "max_ms": max(durations) * 1000 if durations else None,
+        "throughput_rps": len(durations) / total if total else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(durations, p)
+        summary[f"p{p}_ms"] = value * 1000 if value is not None else None
+    return summary
+
+
+# Drives the app in-process through Flask's test client and records the
+# latency of every request, grouped by endpoint name
+class Harness():
+    def __init__(self, app, seed=0):
+        self.app = app
+        self.rng = random.Random(seed)
+        self.samples = {}
+        self.errors = {}
+
+    def request(self, name, client, method, url, expected, **kwargs):
+        start = perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        duration = perf_counter() - start
+
+        self.samples.setdefault(name, []).append(duration)
+        if response.status_code != expected:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    def login(self, email, password, name="POST /login"):
+        client = self.app.test_client()
+        self.request(name, client, "post", "/login", 302, data={"email": email, "password": password})
+        return client
+
+    def results(self):
+        return {name: summarize(durations, self.errors.get(name, 0)) for name, durations in self.samples.items()}
+
+
+# Run every scenario `requests` times against the database the app is
+# configured with, which must have been filled by bench.seed
+def run(app, requests, warmup=5, seed=0):
+    from app.database import db
+    from app.models import User, List, Card
+    from bench.seed import user_email, PASSWORD
+    from sqlalchemy import select, func
+
+    with app.app_context():
+        users = db.session.scalar(select(func.count(User.id)))
+        list_ids = db.session.scalars(select(List.list_id)).all()
+        card_ids = db.session.scalars(select(Card.card_id)).all()
+
+        # a user without lists, so POST /api/list never hits the 5 list limit
+        spare = User(email="spare@bench.local", password="x", name="Spare")
+        db.session.add(spare)
+        db.session.commit()
+        spare_id = spare.id
+
+    harness = Harness(app, seed)
+    rng = harness.rng
+
+    for phase, iterations in (("warmup", warmup), ("measure", requests)):
+        if phase == "measure":
+            harness.samples, harness.errors = {}, {}
+
+        for i in range(iterations):
+            user = rng.randint(1, users)
+            client = harness.login(user_email(user), PASSWORD)
+
+            harness.request("GET /", client, "get", "/", 200)
+            harness.request("GET /summary", client, "get", "/summary", 200)
+
+            if list_ids:
+                list_id = rng.choice(list_ids)
+                harness.request("GET /api/list", client, "get", f"/api/list/{list_id}", 200)
+
+                response = harness.request("POST /api/card", client, "post", "/api/card", 201, json={
+                    "title": "Bench card", "content": "Created by the benchmark", "deadline": "2030-01-01",
+                    "completed": "0", "list": list_id
+                })
+                card_id = response.get_json()["card_id"]
+                harness.request("PUT /api/card", client, "put", f"/api/card/{card_id}", 200, json={
+                    "title": "Bench card", "content": "Updated by the benchmark", "deadline": "2030-01-02",
+                    "completed": "1"
+                })
+                harness.request("DELETE /api/card", client, "delete", f"/api/card/{card_id}", 200)
+
+            if card_ids:
+                harness.request("GET /api/card", client, "get", f"/api/card/{rng.choice(card_ids)}", 200)
+
+            response = harness.request("POST /api/list", client, "post", "/api/list", 201,
+                                       json={"name": "Bench list", "user_id": spare_id})
+            new_list = response.get_json()["list_id"]
+            harness.request("PUT /api/list", client, "put", f"/api/list/{new_list}", 200, json={"name": "Renamed"})
+            harness.request("DELETE /api/list", client, "delete", f"/api/list/{new_list}", 200)
+
+    return harness.results()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the app in-process against a seeded database. "
+                                                 "Configure the app through KANBAN_ENV/DATABASE_URL before running.")
+    parser.add_argument("--requests", type=int, default=100, help="iterations per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="JSON file for the results")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    results = run(app, args.requests, args.warmup, args.seed)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
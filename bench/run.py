@@ -0,0 +1,124 @@
+from bench.seed import seed
+from datetime import datetime
+import subprocess
+import argparse
+import platform
+import tempfile
+import json
+import sys
+import os
+
+
+# "USERSxLISTSxCARDS", e.g. "100x5x50" for 100 users with 5 lists of 50 cards
+def parse_size(size):
+    users, lists, cards = (int(part) for part in size.lower().split("x"))
+    return {"users": users, "lists": lists, "cards": cards}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Seed a database of the given size and run the harness against it in a
+# fresh interpreter, so every size starts from a cold app. With a
+# `concurrency`, the sync and async API are also compared (bench.asgi), with
+# `write_concurrency` per-request and group commits (bench.writes).
+def run_size(size, requests, warmup, directory, concurrency=0, write_concurrency=0):
+    path = os.path.join(directory, f"bench-{size}.sqlite3")
+    output = os.path.join(directory, f"bench-{size}.json")
+    seed(path, **parse_size(size))
+
+    env = dict(os.environ, KANBAN_ENV="production", DATABASE_URL=f"sqlite:///{os.path.abspath(path)}",
+               SECRET_KEY="benchmark")
+    subprocess.run([sys.executable, "-m", "bench.harness", "--requests", str(requests),
+                    "--warmup", str(warmup), "--output", output], env=env, check=True)
+
+    with open(output) as f:
+        results = json.load(f)
+
+    if concurrency:
+        subprocess.run([sys.executable, "-m", "bench.asgi", "--requests", str(requests), "--warmup", str(warmup),
+                        "--concurrency", str(concurrency), "--output", output], env=env, check=True)
+        with open(output) as f:
+            results.update(json.load(f))
+
+    if write_concurrency:
+        subprocess.run([sys.executable, "-m", "bench.writes", "--requests", str(requests), "--warmup", str(warmup),
+                        "--concurrency", str(write_concurrency), "--output", output], env=env, check=True)
+        with open(output) as f:
+            results.update(json.load(f))
+
+    return results
+
+
+# Endpoints whose latency grew by more than `threshold` (0.2 = 20%) compared
+# to the baseline results, for the given metrics
+def compare(results, baseline, threshold, metrics=("p50_ms", "p95_ms")):
+    regressions = []
+    for size, endpoints in results["results"].items():
+        for name, summary in endpoints.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            for metric in metrics:
+                if base.get(metric) and summary.get(metric) and summary[metric] > base[metric] * (1 + threshold):
+                    regressions.append({"size": size, "endpoint": name, "metric": metric,
+                                        "baseline": base[metric], "current": summary[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the kanban app at several data sizes.")
+    parser.add_argument("--sizes", nargs="+", default=["10x5x20", "100x5x100"],
+                        help="data sizes as USERSxLISTSxCARDS")
+    parser.add_argument("--requests", type=int, default=100, help="iterations per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing")
+    parser.add_argument("--asgi-concurrency", type=int, default=0,
+                        help="also compare the sync and async API with this many concurrent clients")
+    parser.add_argument("--write-concurrency", type=int, default=0,
+                        help="also compare per-request and group commits with this many concurrent writers")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+        },
+        "results": {}
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results["results"][size] = run_size(size, args.requests, args.warmup, directory,
+                                                 args.asgi_concurrency, args.write_concurrency)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for size, endpoints in results["results"].items():
+        print(f"{size}:")
+        for name, summary in sorted(endpoints.items()):
+            print(f"  {name:<26} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  "
+                  f"{summary['throughput_rps']:8.1f} req/s  errors {summary['errors']}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['size']} {regression['endpoint']} {regression['metric']}: "
+                  f"{regression['baseline']:.2f} -> {regression['current']:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from werkzeug.security import generate_password_hash
+import argparse
+import sqlite3
+import random
+import os
+
+
+PASSWORD = "password"
+
+
+# Same text format SQLAlchemy uses for SQLite dates and datetimes
+def sql_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f") if value is not None else None
+
+
+def user_email(index):
+    return f"user{index}@bench.local"
+
+
+# Create a fresh SQLite database at `path` with the current schema and fill it
+# with `users` users, `lists` lists each (at most 5, the app's limit) and
+# `cards` cards per list. The same seed always produces the same data.
+def seed(path, users, lists=5, cards=20, seed=0):
+    from app.migrations import upgrade
+    from app.ranks import spaced_ranks
+
+    if lists > 5:
+        raise ValueError("a user cannot have more than 5 lists")
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    today = now.date()
+    created_at = sql_datetime(now)
+    hashed = generate_password_hash(PASSWORD) # hashing is slow, every user shares one password
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO users (id, email, password, name, created_at) VALUES (?, ?, ?, ?, ?)",
+            ((i, user_email(i), hashed, f"User {i}", created_at) for i in range(1, users + 1))
+        )
+        connection.executemany(
+            'INSERT INTO lists (list_id, name, "user", created_at) VALUES (?, ?, ?, ?)',
+            ((u * 5 + l, f"List {l + 1}", u, created_at) for u in range(1, users + 1) for l in range(lists))
+        )
+
+        ranks = spaced_ranks(cards)
+
+        def card_rows():
+            for u in range(1, users + 1):
+                for l in range(lists):
+                    for c in range(cards):
+                        completed = rng.random() < 0.5
+                        completed_datetime = now - timedelta(days=rng.randint(0, 30)) if completed else None
+                        deadline = today + timedelta(days=rng.randint(-30, 30))
+                        yield (f"Card {c + 1}", f"Content of card {c + 1}", deadline.isoformat(), int(completed),
+                               u * 5 + l, created_at, sql_datetime(completed_datetime), ranks[c])
+
+        connection.executemany(
+            "INSERT INTO cards (title, content, deadline, completed, list, created_at, completed_datetime, rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            card_rows()
+        )
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a fresh SQLite database with synthetic kanban data.")
+    parser.add_argument("path", help="database file, replaced if it exists")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=5, help="lists per user, at most 5")
+    parser.add_argument("--cards", type=int, default=20, help="cards per list")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    seed(args.path, args.users, args.lists, args.cards, args.seed)
+
+
+if __name__ == "__main__":
+    main()
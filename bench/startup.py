@@ -0,0 +1,129 @@
+from statistics import median
+from time import perf_counter
+import subprocess
+import argparse
+import tempfile
+import json
+import sys
+import os
+
+
+# Modules that must only be imported on first use, never at startup
+DEFERRED_MODULES = ("matplotlib", "numpy", "PIL", "starlette", "aiosqlite")
+
+# Worker profiles: everything, only the JSON API, only the HTML pages
+PROFILES = {
+    "full": {},
+    "api": {"SERVE_WEB": "0"},
+    "web": {"SERVE_API": "0"},
+}
+
+STARTUP_CODE = f"""
+from app import create_app
+create_app()
+import sys, json, resource
+print(json.dumps({{
+    "deferred_loaded": [name for name in {DEFERRED_MODULES!r} if name in sys.modules],
+    "module_count": len(sys.modules),
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+"""
+
+
+# `python -X importtime` output as {module: cumulative microseconds} for the
+# modules imported directly by the startup code
+def parse_importtime(output):
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if name.startswith("  "): # nested import, counted in its parent
+            continue
+        modules[name.strip()] = int(cumulative_us)
+    return modules
+
+
+# Start the app once in a fresh interpreter
+def measure(env):
+    start = perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+                             env=env, capture_output=True, text=True, check=True)
+    wall = perf_counter() - start
+
+    modules = parse_importtime(process.stderr)
+    stats = json.loads(process.stdout.strip().splitlines()[-1])
+    return {"wall_ms": wall * 1000, "import_ms": sum(modules.values()) / 1000, "imports": modules, **stats}
+
+
+# Median startup of every profile over `runs` interpreters
+def run(runs, directory):
+    env = dict(os.environ, KANBAN_ENV="production", SECRET_KEY="benchmark",
+               DATABASE_URL=f"sqlite:///{os.path.join(directory, 'startup.sqlite3')}")
+
+    results = {}
+    for profile, overrides in PROFILES.items():
+        samples = [measure(dict(env, **overrides)) for i in range(runs)]
+        last = samples[-1]
+        slowest = sorted(last["imports"].items(), key=lambda item: item[1], reverse=True)[:10]
+        results[profile] = {
+            "wall_ms": median(sample["wall_ms"] for sample in samples),
+            "import_ms": median(sample["import_ms"] for sample in samples),
+            "max_rss_mb": median(sample["max_rss_kb"] for sample in samples) / 1024,
+            "module_count": last["module_count"],
+            "deferred_loaded": last["deferred_loaded"],
+            "slowest_imports_ms": {name: us / 1000 for name, us in slowest},
+        }
+    return results
+
+
+# Profiles whose startup grew by more than `threshold` compared to the
+# baseline, plus any deferred module that got imported at startup
+def check(results, baseline, threshold, metrics=("wall_ms", "import_ms", "max_rss_mb")):
+    problems = []
+    for profile, summary in results.items():
+        for name in summary["deferred_loaded"]:
+            problems.append(f"{profile}: {name} is imported at startup")
+
+        base = baseline.get(profile)
+        if base is None:
+            continue
+        for metric in metrics:
+            if base.get(metric) and summary[metric] > base[metric] * (1 + threshold):
+                problems.append(f"{profile}: {metric} {base[metric]:.1f} -> {summary[metric]:.1f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time and memory of the app "
+                                                 "with python -X importtime, for every worker profile.")
+    parser.add_argument("--runs", type=int, default=5, help="interpreters started per profile")
+    parser.add_argument("--output", default="bench-startup.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed growth before failing")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(args.runs, directory)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for profile, summary in results.items():
+        print(f"{profile:<5} wall {summary['wall_ms']:8.1f} ms  imports {summary['import_ms']:8.1f} ms  "
+              f"rss {summary['max_rss_mb']:6.1f} MB  {summary['module_count']} modules")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    problems = check(results, baseline, args.threshold)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from bench.harness import summarize
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import argparse
+import random
+import json
+
+
+# One client creating, updating and deleting cards through the JSON API
+def scenario(client, list_id, samples, errors):
+    def request(name, method, url, expected, **kwargs):
+        start = perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        samples.setdefault(name, []).append(perf_counter() - start)
+        if response.status_code != expected:
+            errors[name] = errors.get(name, 0) + 1
+        return response
+
+    response = request("POST /api/card", "post", "/api/card", 201, json={
+        "title": "Bench card", "content": "Created by the benchmark", "deadline": "2030-01-01",
+        "completed": "0", "list": list_id
+    })
+    if response.status_code != 201:
+        return
+    card_id = response.get_json()["card_id"]
+    request("PUT /api/card", "put", f"/api/card/{card_id}", 200, json={
+        "title": "Bench card", "content": "Updated by the benchmark", "deadline": "2030-01-02",
+        "completed": "1"
+    })
+    request("DELETE /api/card", "delete", f"/api/card/{card_id}", 200)
+
+
+# `requests` scenarios on `concurrency` threads; latency summaries plus the
+# writes per second over the wall time
+def measure(app, prefix, requests, concurrency, list_ids, rng):
+    jobs = [rng.choice(list_ids) for i in range(requests)]
+    per_thread = [(app.test_client(), {}, {}) for i in range(concurrency)]
+
+    def worker(index):
+        client, samples, errors = per_thread[index]
+        for list_id in jobs[index::concurrency]:
+            scenario(client, list_id, samples, errors)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = perf_counter() - start
+
+    samples, errors = {}, {}
+    for client, thread_samples, thread_errors in per_thread:
+        for name, durations in thread_samples.items():
+            samples.setdefault(f"{prefix} {name}", []).extend(durations)
+        for name, count in thread_errors.items():
+            errors[f"{prefix} {name}"] = errors.get(f"{prefix} {name}", 0) + count
+
+    results = {name: summarize(durations, errors.get(name, 0)) for name, durations in samples.items()}
+    total = sum(len(durations) for durations in samples.values())
+    results[f"{prefix} all"] = dict(summarize(sum(samples.values(), []), sum(errors.values())),
+                                    throughput_rps=total / elapsed)
+    return results
+
+
+# Same write scenario with a commit per request ("commit") and with group
+# commit ("group"), `concurrency` clients at a time
+def run(flask_app, requests, concurrency=16, warmup=5, seed=0):
+    from app.database import db
+    from app.models import List
+    from app.writes import write_coalescer
+    from sqlalchemy import select
+
+    with flask_app.app_context():
+        list_ids = db.session.scalars(select(List.list_id)).all()
+
+    results = {}
+    for prefix, group_commit in (("commit", False), ("group", True)):
+        flask_app.config["GROUP_COMMIT"] = group_commit
+        write_coalescer.init_app(flask_app)
+
+        rng = random.Random(seed)
+        measure(flask_app, prefix, warmup, concurrency, list_ids, rng)
+        results.update(measure(flask_app, prefix, requests, concurrency, list_ids, rng))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the write throughput of per-request commits and group "
+                                                 "commit in-process against a seeded database. Configure the app "
+                                                 "through KANBAN_ENV/DATABASE_URL before running.")
+    parser.add_argument("--requests", type=int, default=100, help="scenario iterations per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synchronous", help="override PRAGMA synchronous, e.g. FULL to pay an fsync per commit")
+    parser.add_argument("--output", required=True, help="JSON file for the results")
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.config import get_config
+
+    config = get_config()
+    if args.synchronous:
+        config = type("BenchConfig", (config,), {"SQLITE_PRAGMAS": dict(config.SQLITE_PRAGMAS, synchronous=args.synchronous)})
+
+    app = create_app(config)
+
+    results = run(app, args.requests, args.concurrency, args.warmup, args.seed)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
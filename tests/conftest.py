@@ -0,0 +1,69 @@
+from app import create_app
+from app.config import Config
+from app.database import db
+from app.models import User, List, Card
+from app.caching import payload_cache
+from datetime import date
+import pytest
+
+
+# Factory of apps on a database file, migrated to the latest version. No
+# app context is left pushed: requests get one of their own each, as in
+# production, so nothing in `g` (the logged in user) leaks from one request
+# to the next.
+@pytest.fixture
+def make_app():
+    def make_app(path):
+        class TestConfig(Config):
+            TESTING = True
+            SECRET_KEY = "test"
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+            AUTO_MIGRATE = True
+            FRAGMENT_CACHE = "none"
+
+        app = create_app(TestConfig)
+        payload_cache.clear() # keyed on ids, which every database reuses
+        return app
+
+    return make_app
+
+
+# App on a fresh database of its own
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(tmp_path / "kanban.sqlite3")
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        user = User(email="user@example.com", password="password", name="User")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+# Test client logged in as `user`
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user)
+    return client
+
+
+# Two lists of `user` with three cards each, returns the list ids
+@pytest.fixture
+def board(app, user):
+    list_ids = []
+    with app.app_context():
+        for index in range(2):
+            new_list = List(name=f"list {index}", user=user)
+            db.session.add(new_list)
+            db.session.commit()
+            for number in range(3):
+                db.session.add(Card(title=f"card {number}", content="content", deadline=date(2030, 1, 1),
+                                    completed=0, list=new_list.list_id))
+                db.session.commit()
+            list_ids.append(new_list.list_id)
+    return list_ids
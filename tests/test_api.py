@@ -0,0 +1,111 @@
+from app.database import db
+from app.models import Card
+from sqlalchemy import select, func
+import json
+
+
+def first_card(app, list_id):
+    with app.app_context():
+        return db.session.scalar(select(Card.card_id).where(Card.list == list_id).order_by(Card.card_id))
+
+
+# error_code of a ValidationError response
+def error_code(response):
+    return json.loads(response.data)["error_code"]
+
+
+def test_patch_card_if_match(app, client, board):
+    card_id = first_card(app, board[0])
+    etag = client.get(f"/api/card/{card_id}").headers["ETag"]
+
+    response = client.patch(f"/api/card/{card_id}", json={"title": "first"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json()["title"] == "first"
+    assert response.headers["ETag"] != etag
+
+    # the ETag of the version before is stale now
+    response = client.patch(f"/api/card/{card_id}", json={"title": "second"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert error_code(response) == "C113"
+    assert client.get(f"/api/card/{card_id}").get_json()["title"] == "first"
+
+
+def test_patch_card_if_match_fields_etag(app, client, board):
+    card_id = first_card(app, board[0])
+    etag = client.get(f"/api/card/{card_id}?fields=title").headers["ETag"]
+
+    response = client.patch(f"/api/card/{card_id}", json={"completed": "1"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+
+
+def test_patch_card_without_if_match(app, client, board):
+    card_id = first_card(app, board[0])
+
+    response = client.patch(f"/api/card/{card_id}", json={"content": "changed"})
+    assert response.status_code == 200
+    assert response.get_json()["content"] == "changed"
+
+    assert client.patch("/api/card/999", json={"content": "x"}, headers={"If-Match": '"card-999-1"'}).status_code == 404
+
+
+def test_patch_list_if_match(app, client, board):
+    etag = client.get(f"/api/list/{board[0]}").headers["ETag"]
+
+    # a write to a card of the list does not change the list row
+    client.patch(f"/api/card/{first_card(app, board[0])}", json={"title": "other"})
+    assert client.patch(f"/api/list/{board[0]}", json={"name": "renamed"}, headers={"If-Match": etag}).status_code == 200
+
+    response = client.patch(f"/api/list/{board[0]}", json={"name": "again"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert error_code(response) == "L106"
+
+
+def test_bulk_reports_errors_per_operation(app, client, board):
+    card_id = first_card(app, board[0])
+    with app.app_context():
+        cards = db.session.scalar(select(func.count(Card.card_id)))
+
+    response = client.post("/api/cards/bulk", json={"operations": [
+        {"op": "create", "title": "new", "content": "c", "deadline": "2030-01-01", "completed": "0", "list": board[1]},
+        {"op": "create", "content": "c", "deadline": "2030-01-01", "completed": "0", "list": board[1]},
+        {"op": "create", "title": "new", "content": "c", "deadline": "2030-01-01", "completed": "0", "list": 999},
+        {"op": "update", "card_id": card_id, "title": "t", "content": "c", "deadline": "2030-13-01", "completed": "0"},
+        {"op": "update", "card_id": 999, "title": "t", "content": "c", "deadline": "2030-01-01", "completed": "0"},
+        {"op": "delete", "card_id": card_id},
+        {"op": "rename"},
+        {"op": "delete"},
+    ]})
+    assert response.status_code == 200
+
+    results = response.get_json()["results"]
+    assert [result["index"] for result in results] == list(range(8))
+    assert [result["status"] for result in results] == [201, 400, 404, 400, 404, 200, 400, 400]
+    assert [result.get("error_code") for result in results] == [None, "C101", "L104", "C103", "C106", None, "C107", "C106"]
+
+    # the valid operations are written, the others skipped
+    with app.app_context():
+        assert db.session.get(Card, results[0]["card_id"]).list == board[1]
+        assert db.session.get(Card, card_id) is None
+        assert db.session.scalar(select(func.count(Card.card_id))) == cards
+
+
+def test_bulk_rejects_bad_requests(app, client):
+    assert error_code(client.post("/api/cards/bulk", json={"op": "create"})) == "C107"
+
+    app.config["BULK_MAX_OPERATIONS"] = 2
+    response = client.post("/api/cards/bulk", json=[{"op": "delete", "card_id": 1}] * 3)
+    assert response.status_code == 400
+    assert error_code(response) == "C108"
+
+
+def test_user_routes_need_the_logged_in_user(app, client, user):
+    assert client.get("/api/board").status_code == 200
+    assert client.get(f"/api/board?user_id={user}").status_code == 200
+
+    response = client.get(f"/api/board?user_id={user + 1}")
+    assert response.status_code == 403
+    assert error_code(response) == "U104"
+
+    response = app.test_client().get(f"/api/search?q=card&user_id={user}")
+    assert response.status_code == 401
+    assert error_code(response) == "U103"
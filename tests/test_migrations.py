@@ -0,0 +1,88 @@
+from app.database import db
+from app.models import Card
+from app.migrations import MIGRATIONS, upgrade, current_version, explain
+from app.summary import verify_rollups, summary_counts
+from app.search import fts_query, search_cards
+from sqlalchemy import create_engine, select
+from pathlib import Path
+from datetime import date
+import sqlite3
+import shutil
+import pytest
+
+
+# The database the repository ships with, as created before the migration
+# runner existed
+BASELINE = Path(__file__).resolve().parent.parent / "kanban_db.sqlite3"
+
+
+# Copy of the baseline database with a user, two lists and their cards,
+# written the way the app did before any migration
+@pytest.fixture
+def baseline(tmp_path):
+    path = tmp_path / "kanban.sqlite3"
+    shutil.copy(BASELINE, path)
+
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO users (id, email, password, name) VALUES (1, 'user@example.com', 'password', 'User')")
+    connection.execute("INSERT INTO lists (list_id, name, user) VALUES (1, 'todo', 1), (2, 'done', 1)")
+    connection.executemany(
+        "INSERT INTO cards (title, content, deadline, completed, list, completed_datetime) VALUES (?, ?, ?, ?, ?, ?)", [
+            ("first card", "write the report", "2030-01-01", 0, 1, None),
+            ("second card", "review the report", "2001-01-01", 0, 1, None),
+            ("third card", "send the report", "2030-01-01", 1, 2, "2024-01-05 10:00:00.000000"),
+        ])
+    connection.commit()
+    connection.close()
+    return path
+
+
+def test_upgrade_baseline_database(baseline):
+    engine = create_engine(f"sqlite:///{baseline}")
+    assert current_version(engine) == 0
+
+    applied = upgrade(engine)
+    assert [migration.version for migration in applied] == [migration.version for migration in MIGRATIONS]
+    assert current_version(engine) == MIGRATIONS[-1].version
+
+    # a second run has nothing left to do
+    assert upgrade(engine) == []
+    engine.dispose()
+
+
+def test_upgrade_in_steps(baseline):
+    engine = create_engine(f"sqlite:///{baseline}")
+
+    assert [migration.version for migration in upgrade(engine, target=3)] == [1, 2, 3]
+    assert current_version(engine) == 3
+
+    assert [migration.version for migration in upgrade(engine)] == [migration.version for migration in MIGRATIONS[3:]]
+    engine.dispose()
+
+
+def test_upgraded_database_is_backfilled(baseline, make_app):
+    app = make_app(baseline) # AUTO_MIGRATE
+
+    with app.app_context():
+        assert verify_rollups(today=date(2020, 1, 1)) == []
+        counts = summary_counts(1, today=date(2020, 1, 1))
+        assert counts[1]["total"] == 2
+        assert counts[2]["histogram"] == {date(2024, 1, 5): 1}
+
+        ranks = db.session.execute(select(Card.rank, Card.row_version).where(Card.list == 1).order_by(Card.card_id)).all()
+        assert [row.rank for row in ranks] == sorted(set(row.rank for row in ranks))
+        assert [row.row_version for row in ranks] == [1, 1]
+
+        results = search_cards(1, fts_query("revi"))
+        assert [row.title for row in results] == ["second card"]
+
+
+def test_hot_queries_use_indexes(baseline):
+    engine = create_engine(f"sqlite:///{baseline}")
+    upgrade(engine)
+
+    plans = explain(engine)
+    for name in ("board lists", "board cards", "last rank", "list limit", "summary recount", "list cards page",
+                 "deadlines", "changes page", "archived cards page"):
+        assert not any(step.startswith("SCAN") for step in plans[name]), (name, plans[name])
+    engine.dispose()
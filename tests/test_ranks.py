@@ -0,0 +1,86 @@
+from app.database import db
+from app.models import Card
+from app.ranks import rank_between, spaced_ranks, rebalancer
+from sqlalchemy import select, update
+from time import monotonic, sleep
+import random
+
+
+def test_rank_between_orders_keys():
+    ranks = [rank_between(None, None)]
+    generator = random.Random(0)
+    for _ in range(2000):
+        position = generator.randint(0, len(ranks))
+        lower = ranks[position - 1] if position > 0 else None
+        upper = ranks[position] if position < len(ranks) else None
+        rank = rank_between(lower, upper)
+        assert (lower is None or lower < rank) and (upper is None or rank < upper)
+        assert not rank.endswith("0")
+        ranks.insert(position, rank)
+
+    assert ranks == sorted(ranks)
+
+
+def test_rank_between_appends_short_keys():
+    rank = None
+    for _ in range(200):
+        rank = rank_between(rank, None)
+    assert len(rank) <= 4
+
+
+def test_rank_between_equal_neighbours():
+    assert rank_between("V", "V") is None
+    assert rank_between("W", "V") is None
+
+
+def test_spaced_ranks():
+    for count in (1, 2, 61, 62, 500):
+        ranks = spaced_ranks(count)
+        assert len(ranks) == count
+        assert ranks == sorted(set(ranks))
+        assert not any(rank.endswith("0") for rank in ranks)
+
+
+# Cards of a list in board order, (card_id, rank)
+def card_ranks(app, list_id):
+    with app.app_context():
+        rows = db.session.execute(
+            select(Card.card_id, Card.rank).where(Card.list == list_id).order_by(Card.rank, Card.card_id)).all()
+        return [tuple(row) for row in rows]
+
+
+def test_move_between_cards(app, client, board):
+    first, second, third = [card_id for card_id, rank in card_ranks(app, board[0])]
+
+    response = client.patch(f"/api/card/{third}/move", json={"after": first})
+    assert response.status_code == 200
+
+    assert [card_id for card_id, rank in card_ranks(app, board[0])] == [first, third, second]
+
+
+def test_move_between_equal_ranks_rebalances(app, client, board):
+    first, second, third = [card_id for card_id, rank in card_ranks(app, board[0])]
+    with app.app_context():
+        db.session.execute(update(Card).where(Card.card_id.in_([first, second])).values(rank="V"))
+        db.session.commit()
+
+    response = client.patch(f"/api/card/{third}/move", json={"after": first, "before": second})
+    assert response.status_code == 200
+
+    # the list is rebalanced first, then the card goes between its neighbours
+    low, middle, high = spaced_ranks(3)
+    assert card_ranks(app, board[0]) == [(first, low), (third, rank_between(low, middle)), (second, middle)]
+
+
+def test_long_rank_schedules_rebalance(app, client, board, monkeypatch):
+    monkeypatch.setattr(rebalancer, "max_length", 1)
+    first, second, third = [card_id for card_id, rank in card_ranks(app, board[0])]
+
+    response = client.patch(f"/api/card/{third}/move", json={"after": first})
+    assert len(response.get_json()["rank"]) > 1
+
+    deadline = monotonic() + 5
+    while rebalancer._pending and monotonic() < deadline:
+        sleep(0.01)
+
+    assert card_ranks(app, board[0]) == list(zip([first, third, second], spaced_ranks(3)))
@@ -0,0 +1,98 @@
+from app.database import db
+from app.models import Card
+from app.summary import verify_rollups, summary_counts, rebuild_rollups
+from app.archive import archive_cards
+from sqlalchemy import select, update
+from datetime import datetime, timedelta
+
+
+def assert_no_drift(app):
+    with app.app_context():
+        assert verify_rollups() == []
+
+
+def counts(app):
+    with app.app_context():
+        return summary_counts(None)
+
+
+def first_card(app, list_id):
+    with app.app_context():
+        return db.session.scalar(select(Card.card_id).where(Card.list == list_id).order_by(Card.card_id))
+
+
+def card_payload(list_id, **values):
+    return dict({"title": "new", "content": "content", "deadline": "2030-01-01", "completed": "0", "list": list_id}, **values)
+
+
+def test_rollups_follow_card_writes(app, client, board):
+    deleted = first_card(app, board[0])
+    assert_no_drift(app)
+
+    card_id = client.post("/api/card", json=card_payload(board[0])).get_json()["card_id"]
+    assert_no_drift(app)
+
+    assert client.put(f"/api/card/{card_id}", json=card_payload(board[0], completed="1")).status_code == 200
+    assert_no_drift(app)
+
+    assert client.patch(f"/api/card/{card_id}", json={"completed": "0", "deadline": "2001-01-01"}).status_code == 200
+    assert_no_drift(app)
+
+    assert client.patch(f"/api/card/{card_id}/move", json={"list": board[1]}).status_code == 200
+    assert_no_drift(app)
+
+    response = client.post("/api/cards/bulk", json={"operations": [
+        {"op": "create", **card_payload(board[1], completed="1")},
+        {"op": "update", "card_id": card_id, **card_payload(board[1], completed="1")},
+        {"op": "delete", "card_id": deleted},
+    ]})
+    assert [result["status"] for result in response.get_json()["results"]] == [201, 200, 200]
+    assert_no_drift(app)
+
+    assert client.delete(f"/api/card/{card_id}").status_code == 200
+    assert_no_drift(app)
+
+    after = counts(app)
+    assert after[board[0]]["total"] == 3 - 1
+    assert after[board[1]]["total"] == 3 + 1
+    assert after[board[1]]["total_completed"] == 1
+
+
+def test_rollups_follow_list_writes(app, client, user, board):
+    list_id = client.post("/api/list", json={"name": "new", "user_id": user}).get_json()["list_id"]
+    assert client.post("/api/card", json=card_payload(list_id)).status_code == 201
+    assert_no_drift(app)
+
+    assert client.delete(f"/api/list/{list_id}").status_code == 200
+    assert client.delete(f"/api/list/{board[0]}").status_code == 200
+    assert_no_drift(app)
+
+    assert list(counts(app)) == [board[1]]
+
+
+def test_rollups_follow_archiving(app, board):
+    long_ago = datetime.now() - timedelta(days=200)
+    with app.app_context():
+        db.session.execute(update(Card).where(Card.list == board[0]).values(completed=1, completed_datetime=long_ago))
+        db.session.commit()
+    before = counts(app)
+
+    with app.app_context():
+        assert archive_cards(90, batch_size=2) == 3
+    assert_no_drift(app)
+
+    # archived cards still count, the histogram included
+    after = counts(app)
+    assert after == before
+    assert after[board[0]]["histogram"] == {long_ago.date(): 3}
+
+
+def test_rebuild_rollups_matches_incremental(app, client, board):
+    assert client.patch(f"/api/card/{first_card(app, board[0])}", json={"completed": "1"}).status_code == 200
+    before = counts(app)
+
+    with app.app_context():
+        rebuild_rollups()
+
+    assert counts(app) == before
+    assert_no_drift(app)
@@ -0,0 +1,66 @@
+from app import api
+from app.serializers import Serializer
+from flask_restful import marshal, fields
+from types import SimpleNamespace
+from datetime import datetime, date
+import json
+import pytest
+
+
+def card(card_id, **values):
+    return SimpleNamespace(**dict({
+        "card_id": card_id, "title": f"card {card_id}", "content": "content", "deadline": date(2030, 1, 2),
+        "completed": 1, "list": 1, "created_at": datetime(2024, 2, 29, 23, 59, 1), "updated_at": None,
+        "completed_datetime": datetime(2024, 3, 1, 8, 0), "rank": "V",
+    }, **values))
+
+
+def board_list(list_id, cards):
+    return SimpleNamespace(list_id=list_id, name=f"list {list_id}", user=1, created_at=datetime(2024, 1, 1),
+                           updated_at=datetime(2024, 12, 31, 12, 30), cards=cards)
+
+
+CASES = [
+    ("list_output_fields", board_list(1, [])),
+    ("card_output_fields", card(1)),
+    ("card_output_fields", card(2, completed=0, completed_datetime=None, content=None, rank=None)),
+    ("card_output_fields", {"card_id": "3", "title": 3, "deadline": "2030-01-01", "completed": "0"}),
+    ("board_output_fields", {"user": 1, "lists": [board_list(1, [card(1), card(2)]), board_list(2, [])]}),
+    ("board_output_fields", {"user": 1, "lists": []}),
+    ("card_page_fields", {"cards": [card(1), card(2)], "next_cursor": 2}),
+    ("card_page_fields", {"cards": [], "next_cursor": None}),
+    ("archived_page_fields", {"cards": [card(1, archived_at=datetime(2025, 1, 1))], "next_cursor": None}),
+    ("search_page_fields", {"results": [{"card_id": 1, "title": "a", "list": 1, "deadline": "2030-01-01",
+                                         "completed": 0, "snippet": "[a]", "score": -1.5}], "next_offset": 20}),
+    ("deadline_output_fields", {"user": 1, "today": "2030-01-01", "days": 3,
+                                "overdue": [dict(vars(card(1)), list_name="list 1")], "due_soon": []}),
+    ("changes_page_fields", {"changes": [{"change_id": 1, "entity": "card", "entity_id": 1, "list_id": 1,
+                                          "operation": "update", "changed_at": datetime(2030, 1, 1),
+                                          "data": {"card_id": 1}}], "cursor": 1, "more": False}),
+]
+
+
+# Same keys, in the same order, with the same values as marshal
+@pytest.mark.parametrize("spec_name, obj", CASES)
+def test_serializer_matches_marshal(spec_name, obj):
+    spec = getattr(api, spec_name)
+    assert json.dumps(Serializer(spec)(obj)) == json.dumps(marshal(obj, spec))
+
+
+@pytest.mark.parametrize("names", [("card_id",), ("title", "card_id"), ("rank", "completed_datetime", "list")])
+def test_selection_matches_marshal(names):
+    spec = api.card_output_fields
+    selected = {name: field for name, field in spec.items() if name in names}
+    assert json.dumps(Serializer(spec).select(names)(card(1))) == json.dumps(marshal(card(1), selected))
+
+
+def test_selection_rejects_unknown_field():
+    with pytest.raises(KeyError):
+        Serializer(api.card_output_fields).select(("card_id", "secret"))
+
+
+def test_uncompiled_fields_fall_back_to_marshal():
+    spec = {"when": fields.DateTime(dt_format="iso8601"), "url": fields.FormattedString("/card/{card_id}"),
+            "flag": fields.Boolean, "card_id": fields.Integer}
+    obj = {"when": datetime(2030, 1, 1, 12), "card_id": 7, "flag": 1}
+    assert json.dumps(Serializer(spec)(obj)) == json.dumps(marshal(obj, spec))